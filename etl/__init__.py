@@ -1,6 +1,9 @@
 from .logs import die, info, done, init_logger
-from .api_queries import query_rail, query_station, query_city, query_heritage, query_nature
-from .ds import get_data, save_as_json_geojson, create_fname
-from .trans import open_json, append_tags, overpass_json_to_gpd_gdf, convert_to_gdf, way_to_polygon, reproject, save_as_shp, all_cities_list
+from .api_queries import LAYER_STATEMENTS, LAYER_OUTPUT, query_rail, query_station, query_city, query_heritage, query_nature, query_country, query_bounds
+from .stream import CHUNKSIZE, RAW_EXTENSION, iter_elements, iter_chunks, has_elements, write_raw, raw_exists, raw_path
+from .scheduler import TokenBucket, DownloadScheduler, DownloadError, retry_after
+from .ds import get_data, save_as_json_geojson, create_fname, save_raw, iter_layers, REQUIRED_LAYERS, has_required_layers, save_layers, tile_bboxes, download_tiles, save_as_json, save_file_as_json
+from .storage import BACKENDS, DEFAULT_BACKEND, save_gdf, read_gdf, gdf_path, gdf_exists, remove_gdf, migrate
+from .trans import open_json, append_tags, overpass_json_to_gpd_gdf, convert_to_gdf, convert_in_chunks, way_to_polygon, reproject, save_as_shp, all_cities_list
 
 init_logger()
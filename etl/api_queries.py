@@ -1,3 +1,37 @@
+# Overpass statements of the layers (one line per tag combination) and their output mode
+LAYER_STATEMENTS = {
+    "station": """\
+        node["railway"="stop"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
+        node["railway"="station"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
+        node["public_transport"="stop_position"]["train"="yes"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
+""",
+    "rail": """\
+        way["railway"="narrow_gauge"]["disused:railway"!="rail"]["service"!~"."]["usage"!="military"]["usage"!="industrial"]["usage"!="freight"]["usage"!="tourism"](area.searchArea);
+        way["railway"="rail"]["disused:railway"!="rail"]["service"!~"."]["usage"!="military"]["usage"!="industrial"]["usage"!="freight"]["usage"!="tourism"](area.searchArea);
+""",
+    "city": """\
+        node["place"="city"](area.searchArea);
+        node["place"="town"](area.searchArea);
+""",
+    "heri": """\
+        node["heritage"="1"](area.searchArea);
+        node["heritage"="2"](area.searchArea);
+        node["tourism"="museum"](area.searchArea);
+        way["heritage"="1"](area.searchArea);
+        way["heritage"="2"](area.searchArea);
+        way["tourism"="museum"](area.searchArea);
+        relation["heritage"="1"](area.searchArea);
+        relation["heritage"="2"](area.searchArea);
+        relation["tourism"="museum"](area.searchArea);
+""",
+    "natu": """\
+        way["leisure"="nature_reserve"](area.searchArea);
+        relation["boundary"="protected_area"]["leisure"="nature_reserve"](area.searchArea);
+""",
+}
+LAYER_OUTPUT = {"station": "geom", "rail": "geom", "city": "geom", "heri": "center", "natu": "geom"}
+
+
 def query_station(country: str):
     """ query for extracting stations from country x
     Args:
@@ -14,10 +48,7 @@ def query_station(country: str):
         // perform union with parenthesis
         (
         // AND statement by [key1=value1](and)[key2=value2]
-        node["railway"="stop"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
-        node["railway"="station"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
-        node["public_transport"="stop_position"]["train"="yes"]["subway"!="yes"]["station"!="subway"]["station"!="light_rail"]["light_rail"!="yes"](area.searchArea);
-        );
+{LAYER_STATEMENTS['station']}        );
         (._;);
         out qt geom;
         """ 
@@ -40,9 +71,7 @@ def query_rail(country: str):
         // perform union with parenthesis (unionpart1; unionpart2)
         (
         // AND statement by [key1=value1](and)[key2=value2]
-        way["railway"="narrow_gauge"]["disused:railway"!="rail"]["service"!~"."]["usage"!="military"]["usage"!="industrial"]["usage"!="freight"]["usage"!="tourism"](area.searchArea);
-        way["railway"="rail"]["disused:railway"!="rail"]["service"!~"."]["usage"!="military"]["usage"!="industrial"]["usage"!="freight"]["usage"!="tourism"](area.searchArea);
-        );
+{LAYER_STATEMENTS['rail']}        );
         (._;);
         out qt geom;
         """
@@ -65,9 +94,7 @@ def query_city(country: str):
         // perform union with parenthesis
         (
         // AND statement by [key1=value1](and)[key2=value2]
-        node["place"="city"](area.searchArea);
-        node["place"="town"](area.searchArea);
-        );
+{LAYER_STATEMENTS['city']}        );
         (._;);
         out qt geom;
         """
@@ -90,16 +117,7 @@ def query_heritage(country: str):
         // perform union with parenthesis
         (
         // AND statement by [key1=value1](and)[key2=value2]
-        node["heritage"="1"](area.searchArea);
-        node["heritage"="2"](area.searchArea);
-        node["tourism"="museum"](area.searchArea);
-        way["heritage"="1"](area.searchArea);
-        way["heritage"="2"](area.searchArea);
-        way["tourism"="museum"](area.searchArea);
-        relation["heritage"="1"](area.searchArea);
-        relation["heritage"="2"](area.searchArea);
-        relation["tourism"="museum"](area.searchArea);
-        );
+{LAYER_STATEMENTS['heri']}        );
         out qt center;
         """
     return heritage_query
@@ -121,10 +139,63 @@ def query_nature(country: str):
         // perform union with parenthesis
         (
         // AND statement by [key1=value1](and)[key2=value2]
-        way["leisure"="nature_reserve"](area.searchArea);
-        relation["boundary"="protected_area"]["leisure"="nature_reserve"](area.searchArea);
-        );
+{LAYER_STATEMENTS['natu']}        );
         (._;);
         out qt geom;
         """
-    return nature_query
\ No newline at end of file
+    return nature_query
+
+
+def query_country(country: str, layers: list, bbox: tuple = None):
+    """ combined query for extracting several layers from country x in one request. The search area is resolved once,
+    each layer is collected in its own set and its output is preceded by a marker element of type "layer" (by make),
+    so the response can be split into the layers by def iter_layers and def save_layers (etl/ds.py)
+    Args:
+        country (str): x country name in English (osm tag: int_name) as an argument for the query
+        layers (list): layers of LAYER_STATEMENTS ("station", "rail", "city", "heri", "natu")
+        bbox (tuple): optional tile (south, west, north, east) in degrees, the elements are still clipped by the area
+
+    Returns:
+        str : query for overpass
+    """
+    sets = ""
+    outputs = ""
+    for layer in layers:
+        statements = LAYER_STATEMENTS[layer]
+        if bbox is not None:
+            statements = statements.replace("(area.searchArea);", "(area.searchArea)({},{},{},{});".format(*bbox))
+        sets += f"""
+        (
+{statements}        )->.{layer};"""
+        outputs += f"""
+        make layer name="{layer}";
+        out;
+        .{layer} out qt {LAYER_OUTPUT[layer]};"""
+
+    country_query = f"""
+        // set output to json file
+        [out:json][timeout:600];
+        // set search area to x country in English
+        ( area[int_name="{country}"]; )->.searchArea;
+        // collect every layer in its own set{sets}
+        // output every set after its marker{outputs}
+        """
+    return country_query
+
+
+def query_bounds(country: str):
+    """ query for the bounding box of country x (of its boundary relation)
+    Args:
+        country (str): x country name in English (osm tag: int_name) as an argument for the query
+
+    Returns:
+        str : query for overpass
+    """
+    bounds_query = f"""
+        // set output to json file
+        [out:json];
+        // boundary of x country in English
+        relation["boundary"="administrative"]["admin_level"="2"]["int_name"="{country}"];
+        out bb;
+        """
+    return bounds_query
@@ -1,8 +1,17 @@
 from .logs import die, info
-import requests
+import os
+import math
+import shutil
+import itertools
 import json as js
 import osm2geojson as o2g
 import geojson as geojs
+from .scheduler import DownloadScheduler, DownloadError
+from .api_queries import query_country, query_bounds
+from .stream import iter_elements, write_raw, raw_path
+
+# Layers which cannot be empty in a country (an empty download of them is repeated)
+REQUIRED_LAYERS = ["station", "rail", "city"]
 
 
 def get_data(overpass_url: str, query: str, obj_name: str, country: str):
@@ -16,23 +25,11 @@ def get_data(overpass_url: str, query: str, obj_name: str, country: str):
     Returns: 
         A response data object in json format containing OSM data
     """
-    # Perform a maximum of ten trials to download the data
-    download_attempt = 1
-
-    while download_attempt <= 10:
-        try: 
-            response = requests.get(overpass_url, params={'data': query})
-            data = response.json()
-        except:
-            info(f"EXTRACTION: FAILED DOWNLOAD IN ATTEMPT {download_attempt} FOR {obj_name} IN {country} ")
-            download_attempt += 1
-        else:
-            if data["elements"] == []:
-                info(f"EXTRACTION: DOWNLOADED DATA FOR {obj_name} IN {country} WAS EMPTY IN DOWNLOAD ATTEMPT {download_attempt}")
-                download_attempt += 1
-            else: break
-    else: 
-        die(f"STOPPED DOWNLOAD AFTER ATTEMPT: {download_attempt-1}")
+    # Perform a maximum of ten trials to download the data (with backoff between the trials)
+    try:
+        data = DownloadScheduler(overpass_url, max_workers=1).fetch(query, obj_name, country)
+    except DownloadError as error:
+        die(str(error))
 
     return data
 
@@ -67,4 +64,193 @@ def save_as_json_geojson(overpass_json, filename: str):
     # Save as geojson file
     overpass_geojson = o2g.json2geojson(overpass_json) ## convert to a geojson
     with open(f"{filename}.geojson",mode="w") as file2:
-        geojs.dump(overpass_geojson,file2)
\ No newline at end of file
+        geojs.dump(overpass_geojson,file2)
+
+
+def save_raw(download_fname: str, filename: str):
+    """This function saves a downloaded Overpass json file once in the raw store in folder original (def write_raw)
+    Arg:
+        download_fname: str = Filename of the downloaded json file (with file extension)
+        filename: str = Filename for the saving the files
+    Return:
+        data\original\filename.jsonl.gz
+        data\original\filename.meta.json
+    """
+    write_raw(iter_elements(download_fname), filename)
+
+
+def iter_layers(filename: str):
+    """This function reads the response of a combined query (def query_country) element by element and assigns the
+    elements to the layers. The elements of a layer follow its marker element of type "layer"
+    Arg:
+        filename: str = Filename of the json file of the combined query (with file extension)
+    Return:
+        generator: (layer, element) for every element, (layer, None) for every marker
+    """
+    layer = None
+    for element in iter_elements(filename):
+        if element["type"] == "layer":
+            layer = element["tags"]["name"]
+            yield layer, None
+        elif layer is not None:
+            yield layer, element
+
+
+def has_required_layers(download_fname: str, filenames: dict) -> bool:
+    """This function checks if the downloaded response of a combined query contains elements of every required layer
+    (REQUIRED_LAYERS). Heritage sites and nature parks can be missing in a country, railways, stations and cities not
+    Arg:
+        download_fname: str = Filename of the downloaded json file (with file extension)
+        filenames: dict = {layer: Filename for saving the files of the layer}
+    Return:
+        bool: True if no required layer is empty
+    """
+    missing = [layer for layer in filenames if layer in REQUIRED_LAYERS]
+    for layer, element in iter_layers(download_fname):
+        if element is not None and layer in missing:
+            missing.remove(layer)
+            if missing == []:
+                return True
+
+    if missing != []:
+        info(f"EXTRACTION: NO ELEMENTS OF THE LAYERS {', '.join(missing)} IN THE DOWNLOAD")
+    return missing == []
+
+
+def save_layers(download_fname: str, filenames: dict):
+    """This function splits the downloaded response of a combined query into the layers and saves each layer like
+    def save_raw. The elements are streamed from the downloaded file into the raw store
+    Arg:
+        download_fname: str = Filename of the downloaded json file (with file extension)
+        filenames: dict = {layer: Filename for saving the files of the layer}
+    """
+    saved = []
+    for layer, pairs in itertools.groupby(iter_layers(download_fname), key=lambda pair: pair[0]):
+        if layer in filenames and layer not in saved:
+            write_raw((element for _, element in pairs if element is not None), filenames[layer])
+            saved.append(layer)
+
+
+def tile_bboxes(bounds: tuple, tile_size: float) -> list:
+    """This function divides a bounding box into a grid of tiles
+    Arg:
+        bounds: tuple = Bounding box (south, west, north, east) in degrees
+        tile_size: float = Size of the tiles in degrees
+    Return:
+        list: [(south, west, north, east)] of the tiles
+    """
+    south, west, north, east = bounds
+    n_rows = max(1, math.ceil((north - south) / tile_size))
+    n_columns = max(1, math.ceil((east - west) / tile_size))
+    tiles = []
+    for row in range(n_rows):
+        for column in range(n_columns):
+            tiles.append((round(south + row * tile_size, 6), round(west + column * tile_size, 6),
+                          round(min(north, south + (row + 1) * tile_size), 6), round(min(east, west + (column + 1) * tile_size), 6)))
+    return tiles
+
+
+def download_tiles(scheduler, country: str, filenames: dict, tile_size: float, tile_dir: str, bounds: tuple = None):
+    """This function downloads the layers of a big country in tiles of its bounding box. The tiles are downloaded
+    concurrently by the scheduler and every downloaded tile is kept in tile_dir, so an interrupted extraction resumes
+    with the missing tiles. Elements in several tiles are kept once (by type and id) and the area filter of the query
+    clips the tiles to the country. The tiles cover the given bounds (e.g. the mainland of a country with overseas
+    territories) or else the bounding box of the boundary relation of the country
+    Arg:
+        scheduler: DownloadScheduler = The scheduler for the requests
+        country: str = The country in international spelling
+        filenames: dict = {layer: Filename for saving the files of the layer}
+        tile_size: float = Size of the tiles in degrees
+        tile_dir: str = Folder for the downloaded tiles
+        bounds: tuple = Optional area of the tiles (south, west, north, east) in degrees
+    Return:
+        bool: False if the bounding box of the country was not found (nothing is downloaded)
+        data\original\filename.jsonl.gz
+        data\original\filename.meta.json
+    """
+    os.makedirs(tile_dir, exist_ok=True)
+    layers = list(filenames)
+
+    # bounding box of the country (stored for resuming)
+    if bounds is not None:
+        if os.path.exists(f"{tile_dir}/bounds.json") == True:
+            with open(f"{tile_dir}/bounds.json") as file:
+                if js.load(file) != list(bounds):
+                    # the tiles of other bounds do not belong to this grid
+                    shutil.rmtree(tile_dir)
+                    os.makedirs(tile_dir)
+        save_as_json(list(bounds), f"{tile_dir}/bounds")
+    elif os.path.exists(f"{tile_dir}/bounds.json") == False:
+        try:
+            bounds_json = scheduler.fetch(query_bounds(country), 'Bounds', country, allow_empty=True)
+        except DownloadError as error:
+            die(str(error))
+        if bounds_json["elements"] == [] or "bounds" not in bounds_json["elements"][0]:
+            info(f"EXTRACTION: NO BOUNDARY FOUND FOR {country}, IT IS DOWNLOADED WITHOUT TILES")
+            shutil.rmtree(tile_dir)
+            return False
+        bounds = bounds_json["elements"][0]["bounds"]
+        save_as_json([bounds["minlat"], bounds["minlon"], bounds["maxlat"], bounds["maxlon"]], f"{tile_dir}/bounds")
+    with open(f"{tile_dir}/bounds.json") as file:
+        bounds = js.load(file)
+
+    # download the tiles which are not in tile_dir yet
+    tiles = tile_bboxes(bounds, tile_size)
+    jobs = []
+    for tile, bbox in enumerate(tiles):
+        if os.path.exists(f"{tile_dir}/tile_{tile}.json") == False:
+            jobs.append((query_country(country, layers, bbox), f'Tile {tile + 1} of {len(tiles)}', country, f"{tile_dir}/tile_{tile}"))
+        else:
+            info(f"EXTRACTION OF TILE {tile + 1} OF {len(tiles)} IN {country} HAS ALREADY BEEN DONE")
+    if jobs != []:
+        info(f"EXTRACTION: DOWNLOADING {len(jobs)} OF {len(tiles)} TILES IN {country}")
+        scheduler.download(jobs, save_file_as_json)
+
+    # merge the tiles layer by layer without the elements which are in more than one tile
+    for layer in layers:
+        keys = set()
+
+        def layer_elements():
+            for tile in range(len(tiles)):
+                for tile_layer, element in iter_layers(f"{tile_dir}/tile_{tile}.json"):
+                    if tile_layer == layer and element is not None and (element["type"], element["id"]) not in keys:
+                        keys.add((element["type"], element["id"]))
+                        yield element
+
+        meta = write_raw(layer_elements(), filenames[layer])
+        info(f"EXTRACTION: MERGED {meta['elements']} ELEMENTS OF {layer} FROM {len(tiles)} TILES IN {country}")
+        if meta["elements"] == 0 and layer in REQUIRED_LAYERS:
+            # not kept in the raw store, the tiles are downloaded again in the next extraction
+            os.remove(raw_path(filenames[layer]))
+            os.remove(f"{filenames[layer]}.meta.json")
+            shutil.rmtree(tile_dir)
+            die(f"EXTRACTION: NO ELEMENTS OF {layer} IN THE TILES OF {country}")
+
+    shutil.rmtree(tile_dir)
+
+    return True
+
+
+def save_as_json(overpass_json, filename: str):
+    """This function saves the overpass query results in json format in a json file
+    Arg:
+        overpass_json = Json format of the Overpass result
+        filename: str = Filename for the saving the file
+    Return:
+        filename.json
+    """
+    # written to a temporary file first, so an interrupted download never leaves an incomplete file
+    with open(f"{filename}.json.part", mode="w") as file:
+        js.dump(overpass_json, file)
+    os.replace(f"{filename}.json.part", f"{filename}.json")
+
+
+def save_file_as_json(download_fname: str, filename: str):
+    """This function saves a downloaded Overpass json file as json file
+    Arg:
+        download_fname: str = Filename of the downloaded json file (with file extension)
+        filename: str = Filename for the saving the file
+    Return:
+        filename.json
+    """
+    shutil.move(download_fname, f"{filename}.json")
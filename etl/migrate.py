@@ -0,0 +1,23 @@
+"""Converts stored GeoDataFrames (e.g. the shapefiles of older versions) to a storage backend of etl/storage.py
+
+    python -m etl.migrate [directories] [--backend parquet|feather|shapefile]
+"""
+import argparse
+from .logs import info
+from .storage import BACKENDS, DEFAULT_BACKEND, migrate
+
+
+def main():
+    """Parses the command line and migrates the directories"""
+    parser = argparse.ArgumentParser(description="Convert stored GeoDataFrames (e.g. old shapefiles) to a storage backend")
+    parser.add_argument("directories", nargs="*", default=["data/processed", "data/route"], help="directories with stored data")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS), help="storage backend")
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        n_migrated = migrate(directory, args.backend)
+        info(f"STORAGE: MIGRATED {n_migrated} FILES IN {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import os
+import time
+import random
+import tempfile
+import threading
+import email.utils
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from .logs import die, info
+from .stream import ijson, has_elements
+
+# parse errors of incomplete responses
+ijson_errors = ijson.JSONError if ijson is not None else ValueError
+
+# HTTP status codes of the Overpass API which mean "try again later"
+RETRY_STATUS = (429, 502, 503, 504)
+
+
+class DownloadError(Exception):
+    """Raised when a download failed in all attempts"""
+
+
+class TokenBucket:
+    """Token bucket which limits the rate of the requests to one host. A request takes one token, the tokens are
+    refilled with the given rate up to the capacity (the number of requests which can be sent at once)
+
+    Args:
+        rate (float): Tokens per second
+        capacity (int): Maximum number of tokens
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes one token and waits until one is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Empties the bucket so that no request is sent to the host for the given time (e.g. after HTTP 429)"""
+        with self.lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.updated = time.monotonic()
+
+
+def retry_after(response: requests.Response) -> float:
+    """Returns the waiting time in seconds of the Retry-After header of a response (None if it has none or it is
+    malformed)
+
+    Args:
+        response (requests.Response): The response of the server
+
+    Returns:
+        float: Seconds to wait or None
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # malformed HTTP-date: the normal backoff is used
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class DownloadScheduler:
+    """Scheduler for the downloads from the Overpass API. The queries are sent by a bounded number of threads over one
+    HTTP session, the requests to each host are limited by a token bucket and failed requests are repeated with
+    exponential backoff (or after the time the server asks for by Retry-After on HTTP 429/504)
+
+    Args:
+        overpass_url (str): Url of the Overpass API interpreter (e.g. of a local stub server for testing)
+        max_workers (int): Maximum number of concurrent requests
+        rate (float): Requests per second to one host
+        burst (int): Requests which can be sent at once to one host
+        max_attempts (int): Attempts per query before the download fails
+        backoff (float): Waiting time in seconds after the first failed attempt, doubled for each further attempt
+        max_backoff (float): Maximum waiting time in seconds between two attempts
+        timeout (float): Timeout of a request in seconds
+        session (requests.Session): Optional session, a new one is created by default
+        download_dir (str): Folder for the temporary files of the downloads (the system temp folder by default)
+    """
+
+    def __init__(self, overpass_url: str, max_workers: int = 2, rate: float = 0.5, burst: int = 2, max_attempts: int = 10,
+                 backoff: float = 5, max_backoff: float = 300, timeout: float = 600, session: requests.Session = None,
+                 download_dir: str = None):
+        self.overpass_url = overpass_url
+        self.max_workers = max_workers
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.download_dir = download_dir
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, url: str) -> TokenBucket:
+        """Returns the token bucket of the host of the url"""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def _wait(self, attempt: int) -> float:
+        """Returns the exponential backoff with jitter after the failed attempt"""
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def _request(self, query: str, obj_name: str, country: str, read, stream: bool = False):
+        """Sends the query to the Overpass API until read gives back a result. Failed requests, error status codes and
+        empty results are repeated up to max_attempts times
+
+        Args:
+            query (str): Query in string format of Overpass query language
+            obj_name (str): Takes the name of the object for messages
+            country (str): Takes the name of the country for messages
+            read (function): Function (response) which gives back the result or None if the result is empty
+            stream (bool): Do not download the response body before read is called
+
+        Returns:
+            The result of read
+        """
+        bucket = self._bucket(self.overpass_url)
+        for attempt in range(1, self.max_attempts + 1):
+            bucket.acquire()
+            wait = None
+            try:
+                with self.session.get(self.overpass_url, params={'data': query}, timeout=self.timeout, stream=stream) as response:
+                    if response.status_code in RETRY_STATUS:
+                        wait = retry_after(response)
+                        info(f"EXTRACTION: HTTP {response.status_code} IN ATTEMPT {attempt} FOR {obj_name} IN {country}")
+                        if wait is not None:
+                            bucket.pause(wait)
+                    else:
+                        response.raise_for_status()
+                        result = read(response)
+                        if result is not None:
+                            return result
+                        info(f"EXTRACTION: DOWNLOADED DATA FOR {obj_name} IN {country} WAS EMPTY OR INCOMPLETE IN DOWNLOAD ATTEMPT {attempt}")
+            except (requests.RequestException, ValueError, KeyError, ijson_errors):
+                info(f"EXTRACTION: FAILED DOWNLOAD IN ATTEMPT {attempt} FOR {obj_name} IN {country} ")
+
+            if attempt < self.max_attempts:
+                time.sleep(wait if wait is not None else self._wait(attempt))
+
+        raise DownloadError(f"STOPPED DOWNLOAD OF {obj_name} IN {country} AFTER ATTEMPT: {self.max_attempts}")
+
+    def fetch(self, query: str, obj_name: str, country: str, allow_empty: bool = False) -> dict:
+        """This function sends the query to the Overpass API and gives back the JSON response (in memory, for small
+        results)
+
+        Args:
+            query (str): Query in string format of Overpass query language
+            obj_name (str): Takes the name of the object for messages
+            country (str): Takes the name of the country for messages
+            allow_empty (bool): Give back an empty result instead of repeating the query
+
+        Returns:
+            dict: A response data object in json format containing OSM data
+        """
+        def read(response):
+            data = response.json()
+            return data if data["elements"] != [] or allow_empty == True else None
+
+        return self._request(query, obj_name, country, read)
+
+    def fetch_to_file(self, query: str, obj_name: str, country: str, filename: str, check=None) -> str:
+        """This function sends the query to the Overpass API and streams the response body straight into a file, so
+        the response is never held in memory
+
+        Args:
+            query (str): Query in string format of Overpass query language
+            obj_name (str): Takes the name of the object for messages
+            country (str): Takes the name of the country for messages
+            filename (str): Filename of the downloaded json file (with file extension)
+            check (function): Optional function (filename) which tells if the download is complete, an incomplete
+                download is repeated like an empty one
+
+        Returns:
+            str: The filename
+        """
+        def read(response):
+            with open(filename, "wb") as file:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    file.write(chunk)
+            if has_elements(filename) == False or (check is not None and check(filename) == False):
+                return None
+            return filename
+
+        return self._request(query, obj_name, country, read, stream=True)
+
+    def download(self, jobs: list, save, check=None) -> None:
+        """This function downloads the queries concurrently and saves each result as soon as it is downloaded. The
+        responses are streamed into temporary files in download_dir, which are handed to save. The process stops
+        (like def get_data) if a download failed, after the other downloads are finished
+
+        Args:
+            jobs (list): [(query, obj_name, country, filename)] one job for each download
+            save (function): Function (downloaded file, filename) which saves a result, e.g. def save_raw
+            check (function): Optional function (downloaded file, filename) which tells if a download is complete
+                (e.g. def has_required_layers), incomplete downloads are repeated
+        """
+        def run(job):
+            query, obj_name, country, filename = job
+            info(f"EXTRACTION: DOWNLOADING {obj_name} DATA IN {country}")
+            handle, download_fname = tempfile.mkstemp(suffix=".json", dir=self.download_dir)
+            os.close(handle)
+            try:
+                self.fetch_to_file(query, obj_name, country, download_fname,
+                                   None if check is None else lambda fname: check(fname, filename))
+                save(download_fname, filename)
+            finally:
+                if os.path.exists(download_fname):
+                    os.remove(download_fname)
+            info(f"EXTRACTION: COMPLETED {obj_name} IN {country}")
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(jobs)))) as pool:
+            futures = [pool.submit(run, job) for job in jobs]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except DownloadError as error:
+                    info(str(error))
+                    failed.append(error)
+
+        if failed != []:
+            die(f"EXTRACTION: {len(failed)} OF {len(jobs)} DOWNLOADS FAILED")
@@ -0,0 +1,144 @@
+import os
+import shutil
+import geopandas as gpd
+from .logs import info
+try:
+    import pyarrow
+except ImportError:
+    # without pyarrow the GeoDataFrames are stored as shapefiles
+    pyarrow = None
+
+# Storage formats of the GeoDataFrames and their file extension (a shapefile is a directory without extension)
+BACKENDS = {"parquet": ".parquet", "feather": ".feather", "shapefile": ""}
+DEFAULT_BACKEND = "parquet"
+
+
+def _backend(backend: str) -> str:
+    """Returns the backend which is used for saving (shapefile if pyarrow is not installed)"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if backend != "shapefile" and pyarrow is None:
+        return "shapefile"
+    return backend
+
+
+def _stored_backend(fname: str) -> str:
+    """Returns the backend in which fname is stored (None if it is not stored)"""
+    for backend, extension in BACKENDS.items():
+        if backend == "shapefile":
+            if os.path.isdir(fname) and any(file.endswith(".shp") for file in os.listdir(fname)):
+                return backend
+        elif os.path.exists(f"{fname}{extension}"):
+            return backend
+    return None
+
+
+def gdf_path(fname: str) -> str:
+    """Returns the file (or shapefile directory) in which fname is stored (None if it is not stored)
+
+    Args:
+        fname (str): Filename without file extension (e.g. data/processed/cities)
+
+    Returns:
+        str: Path with file extension
+    """
+    backend = _stored_backend(fname)
+    if backend is None:
+        return None
+    return f"{fname}{BACKENDS[backend]}"
+
+
+def gdf_exists(fname: str) -> bool:
+    """Checks if fname is stored in one of the backends"""
+    return _stored_backend(fname) is not None
+
+
+def remove_gdf(fname: str) -> None:
+    """Removes fname from all backends"""
+    for backend, extension in BACKENDS.items():
+        if backend == "shapefile":
+            if os.path.isdir(fname):
+                shutil.rmtree(fname)
+        elif os.path.exists(f"{fname}{extension}"):
+            os.remove(f"{fname}{extension}")
+
+
+def save_gdf(geo_df: gpd.GeoDataFrame, fname: str, backend: str = DEFAULT_BACKEND) -> None:
+    """This function saves a GeoDataFrame with the storage backend. GeoParquet and Feather keep the full column names,
+    the text and the crs and are much faster to read and write than shapefiles. A copy of fname in another backend is
+    removed, so a read always finds the latest data
+
+    Args:
+        geo_df (gpd.GeoDataFrame): The geodata
+        fname (str): Filename without file extension (e.g. data/processed/cities)
+        backend (str): "parquet" (GeoParquet), "feather" or "shapefile"
+    """
+    backend = _backend(backend)
+    remove_gdf(fname)
+    if backend == "parquet":
+        geo_df.to_parquet(f"{fname}.parquet", index=False)
+    elif backend == "feather":
+        # uncompressed, so that the file can be memory-mapped when it is read
+        geo_df.to_feather(f"{fname}.feather", index=False, compression="uncompressed")
+    else:
+        geo_df.to_file(driver='ESRI Shapefile', filename=f"{fname}")
+
+
+def read_gdf(fname: str, columns: list = None) -> gpd.GeoDataFrame:
+    """This function reads a GeoDataFrame saved by def save_gdf in any backend. GeoParquet and Feather files are
+    memory-mapped and only the selected columns are read
+
+    Args:
+        fname (str): Filename without file extension (e.g. data/processed/cities)
+        columns (list): Columns which are read (the geometry is always read), all columns by default
+
+    Returns:
+        gpd.GeoDataFrame
+    """
+    backend = _stored_backend(fname)
+    if backend is None:
+        raise FileNotFoundError(f"No stored data for {fname}")
+    if columns is not None and "geometry" not in columns:
+        columns = list(columns) + ["geometry"]
+
+    if backend == "parquet":
+        return gpd.read_parquet(f"{fname}.parquet", columns=columns, memory_map=True)
+    if backend == "feather":
+        return gpd.read_feather(f"{fname}.feather", columns=columns, memory_map=True)
+
+    geo_df = gpd.read_file(fname)
+    if columns is not None:
+        geo_df = geo_df[[column for column in columns if column in geo_df.columns]]
+    return geo_df
+
+
+def migrate(directory: str, backend: str = DEFAULT_BACKEND) -> int:
+    """This function converts all GeoDataFrames in a directory (and its subdirectories, e.g. z_database) to the
+    storage backend
+
+    Args:
+        directory (str): Directory with stored data (e.g. data/processed)
+        backend (str): "parquet" (GeoParquet), "feather" or "shapefile"
+
+    Returns:
+        int: Number of converted GeoDataFrames
+    """
+    backend = _backend(backend)
+    fnames = []
+    for root, dirs, files in os.walk(directory):
+        if any(file.endswith(".shp") for file in files):
+            fnames.append(root)
+        for file in files:
+            for extension in (".parquet", ".feather"):
+                if file.endswith(extension):
+                    fnames.append(os.path.join(root, file[:-len(extension)]))
+
+    n_migrated = 0
+    for fname in sorted(set(fnames)):
+        if _stored_backend(fname) != backend:
+            save_gdf(read_gdf(fname), fname, backend)
+            info(f"STORAGE: MIGRATED {fname} TO {backend}")
+            n_migrated += 1
+
+    return n_migrated
+
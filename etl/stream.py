@@ -0,0 +1,133 @@
+import os
+import gzip
+import json
+import hashlib
+import itertools
+from datetime import datetime, timezone
+try:
+    import ijson
+except ImportError:
+    # without ijson the files are parsed in one piece
+    ijson = None
+
+# Number of OSM elements which are converted at once
+CHUNKSIZE = 20000
+# File extension of the raw store (gzip compressed json lines, one element per line)
+RAW_EXTENSION = ".jsonl.gz"
+# gzip compression level of the raw store (1 fastest, 9 smallest)
+COMPRESSLEVEL = 6
+
+
+def iter_elements(filename: str):
+    """This function reads the elements of a saved Overpass json file (or of a file of the raw store) one after another
+    with an iterative parser, so the file is never loaded as a whole
+
+    Args:
+        filename (str): Filename of the json file (with file extension)
+
+    Returns:
+        generator: The element dictionaries
+    """
+    if filename.endswith(RAW_EXTENSION):
+        with gzip.open(filename, "rb") as file:
+            for line in file:
+                yield json.loads(line)
+        return
+
+    with open(filename, "rb") as file:
+        if ijson is not None:
+            for element in ijson.items(file, "elements.item", use_float=True):
+                yield element
+        else:
+            for element in json.load(file)["elements"]:
+                yield element
+
+
+def iter_chunks(filename: str, chunksize: int = CHUNKSIZE):
+    """This function reads the elements of a saved Overpass json file in chunks
+
+    Args:
+        filename (str): Filename of the json file (with file extension)
+        chunksize (int): Number of elements in a chunk
+
+    Returns:
+        generator: Overpass json dictionaries {"elements": [...]} with at most chunksize elements
+    """
+    elements = iter_elements(filename)
+    while True:
+        chunk = list(itertools.islice(elements, chunksize))
+        if chunk == []:
+            return
+        yield {"elements": chunk}
+
+
+def has_elements(filename: str) -> bool:
+    """Checks if a saved Overpass json file contains at least one element (without reading the whole file)"""
+    for _ in iter_elements(filename):
+        return True
+    return False
+
+
+def write_raw(elements, filename: str) -> dict:
+    """This function writes elements to the raw store: a gzip compressed file of json lines (filename.jsonl.gz) and a
+    metadata file (filename.meta.json) with the number of elements, the sha256 hash of the uncompressed content and
+    the download time. Both are written to temporary files first, so an interrupted write never leaves an incomplete
+    file
+
+    Args:
+        elements (iterable): The element dictionaries
+        filename (str): Filename for saving the files (without file extension)
+
+    Returns:
+        dict: The metadata
+    """
+    sha256 = hashlib.sha256()
+    n_elements = 0
+    elements = iter(elements)
+    with gzip.open(f"{filename}{RAW_EXTENSION}.part", mode="wb", compresslevel=COMPRESSLEVEL) as file:
+        while True:
+            chunk = list(itertools.islice(elements, CHUNKSIZE))
+            if chunk == []:
+                break
+            lines = "".join(json.dumps(element, separators=(",", ":")) + "\n" for element in chunk).encode()
+            sha256.update(lines)
+            file.write(lines)
+            n_elements += len(chunk)
+
+    meta = {"elements": n_elements, "sha256": sha256.hexdigest(),
+            "downloaded": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    with open(f"{filename}.meta.json.part", mode="w") as file:
+        json.dump(meta, file, indent=2)
+    os.replace(f"{filename}.meta.json.part", f"{filename}.meta.json")
+    os.replace(f"{filename}{RAW_EXTENSION}.part", f"{filename}{RAW_EXTENSION}")
+
+    return meta
+
+
+def raw_exists(filename: str) -> bool:
+    """Checks if a download is in the raw store or was saved completely in the old format (json and geojson file)
+
+    Args:
+        filename (str): Filename of the download (without file extension)
+
+    Returns:
+        bool
+    """
+    if os.path.exists(f"{filename}{RAW_EXTENSION}"):
+        return True
+    return os.path.exists(f"{filename}.json") and os.path.exists(f"{filename}.geojson")
+
+
+def raw_path(filename: str) -> str:
+    """Returns the file of a download for def iter_elements: the file of the raw store or the json file of the old
+    format
+
+    Args:
+        filename (str): Filename of the download (without file extension)
+
+    Returns:
+        str: Filename with file extension
+    """
+    if os.path.exists(f"{filename}{RAW_EXTENSION}"):
+        return f"{filename}{RAW_EXTENSION}"
+    return f"{filename}.json"
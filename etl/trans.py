@@ -1,7 +1,9 @@
 import json
 import shapely.geometry as sg
+import pandas as pd
 import geopandas as gpd
 import osm2geojson as o2g
+from .stream import CHUNKSIZE, iter_chunks
 
 def open_json(filename: str):
     """
@@ -248,6 +250,28 @@ def convert_to_gdf(json_file: dict, desired_tags: dict, geometry_list: list) ->
     return shape_gdf
 
 
+def convert_in_chunks(filename: str, convert, desired_tags: dict, geometry_list: list, chunksize: int = CHUNKSIZE) -> gpd.GeoDataFrame:
+    """This function converts a saved Overpass json file chunk by chunk: the elements are read with an iterative parser
+    and each chunk is converted on its own, so the memory depends on the chunk size and not on the size of the country
+
+    Args:
+        filename (str): Filename of the json file (with file extension)
+        convert (function): Conversion of an Overpass json dictionary (def convert_to_gdf or def overpass_json_to_gpd_gdf)
+        desired_tags (dict): OSM tags which should be included as columns in the GeoDataFrame
+        geometry_list (list): List of accepted geometry types
+        chunksize (int): Number of elements which are converted at once
+
+    Returns:
+        gpd.GeoDataFrame
+    """
+    chunk_gdfs = [convert(chunk, desired_tags, geometry_list) for chunk in iter_chunks(filename, chunksize)]
+    if chunk_gdfs == []:
+        # an empty layer (e.g. no nature parks in a small country)
+        return gpd.GeoDataFrame(columns=list(desired_tags), geometry=[], crs="EPSG:4326")
+
+    return gpd.GeoDataFrame(pd.concat(chunk_gdfs, ignore_index=True), geometry="geometry", crs="EPSG:4326")
+
+
 def way_to_polygon(geo_df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """This function converts possible LineStrings and MultiLineStrings into Polygons and Multipolygons
 
@@ -268,6 +292,8 @@ def way_to_polygon(geo_df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         elif row["geometry"].geom_type == 'Polygon' or row["geometry"].geom_type == 'MultiPolygon':
             return row["geometry"]
 
+    if geo_df.empty:
+        return geo_df
     geo_df["geometry"] = geo_df.apply(lambda row: check_geom_type(row), axis=1)
     geo_df = geo_df[geo_df["geometry"]!=None]
 
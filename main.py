@@ -3,10 +3,20 @@ import routing as r
 import time
 import sys
 import geopandas as gpd
+import pandas as pd
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 URL = "http://overpass-api.de/api/interpreter"
+DOWNLOAD_WORKERS = 2 # concurrent requests to the Overpass API (it allows only a few slots per IP)
+DOWNLOAD_RATE = 0.5 # requests per second to the Overpass API
+COMBINED_QUERY = True # one query for all layers of a country instead of one query per layer
+# downloaded in tiles of the mainland (south, west, north, east), overseas territories are not in the rail network
+TILED_COUNTRIES = {"France": (41.3, -5.2, 51.1, 9.6), "Germany": (47.2, 5.8, 55.1, 15.1), "Italia": (35.4, 6.6, 47.1, 18.6),
+                   "Norway": (57.9, 4.5, 71.2, 31.2), "Polska": (49.0, 14.1, 54.9, 24.2), "Spain": (35.9, -9.4, 43.8, 4.4),
+                   "Sweden": (55.3, 10.9, 69.1, 24.2)} # spelling as in server.py
+TILE_SIZE = 2 # size of the tiles in degrees
 NAME_RAIL = "railways"
 COLUMNS_RAIL = {"name": str}
 NAME_STAT = "stations"
@@ -20,6 +30,17 @@ COLUMNS_NATU = {"name": str}
 DOWNLOAD_DIR = "data/original"
 PROCESSED_DIR = "data/processed"
 EPSG = "EPSG:32629"
+ROUTING_ENGINE = "csr" # "networkx" graph, "csr" arrays or "ch" contraction hierarchy for the shortest path calculation
+ONE_TO_MANY = True # one search per origin station instead of one search per pair of stations
+WORKERS = 1 # number of worker processes for the distance matrix (with ONE_TO_MANY), spawned workers (Windows) get a copy of the network
+TSP_SOLVER = "auto" # "held_karp" (exact), "ortools", "two_opt" or "auto" (by the number of stops)
+TSP_TIME_LIMIT = 5 # maximum seconds for the solvers "ortools" and "two_opt" (both stop earlier when the route no longer improves)
+CACHE_DIR = "data/cache" # cache for the shortest paths between stations (None to switch it off)
+NODING_GRID = 0.1 # grid in meters for the coordinates of the network, segment ends in the same cell are connected
+SIMPLIFY_NETWORK = True # merge the rail segments between stations, junctions and borders into single edges
+PREPROCESSING_WORKERS = os.cpu_count() or 1 # number of worker processes for the preprocessing of the countries
+LAYERS = ["station", "rail", "city", "heri", "natu"]
+STORAGE_BACKEND = "parquet" # "parquet" (GeoParquet), "feather" or "shapefile" for data/processed and data/route
 
 # Create the data folders
 if os.path.exists("data") == False:
@@ -44,6 +65,10 @@ fname_station_processed = e.create_fname(NAME_STAT, PROCESSED_DIR)
 fname_city_processed = e.create_fname(NAME_CITY, PROCESSED_DIR)
 fname_heri_processed = e.create_fname(NAME_HERI, PROCESSED_DIR)
 fname_natu_processed = e.create_fname(NAME_NATU, PROCESSED_DIR)
+fname_ch_processed = e.create_fname("contraction_hierarchy", PROCESSED_DIR)
+fname_link_processed = e.create_fname("links", PROCESSED_DIR)
+fname_segments_processed = e.create_fname("rail_segments", PROCESSED_DIR)
+fname_countries_processed = f"{e.create_fname('countries', PROCESSED_DIR)}.txt"
 
 def extraction(countries: list) -> None:
     """ Runs extraction of data from OpenStreetMap via Overpass API
@@ -53,169 +78,274 @@ def extraction(countries: list) -> None:
     """
     
     e.info("EXTRACTION: START DATA EXTRACTION")
-    
+
+    # collect the downloads which have not been done yet
+    jobs = []
     for country in countries:
         # Railway data from OSM
-        if os.path.exists(f"{fname_rail_original}_{country}.geojson") == False:
-            query_rail = e.query_rail(country)
-            e.info(f"EXTRACTION: DOWNLOADING RAILS DATA IN {country}")
-            rail_data = e.get_data(URL, query_rail, 'Railways', country)
-            e.save_as_json_geojson(rail_data, f"{fname_rail_original}_{country}")
+        if e.raw_exists(f"{fname_rail_original}_{country}") == False:
+            jobs.append(("rail", e.query_rail(country), 'Railways', country, f"{fname_rail_original}_{country}"))
         else:
             e.info(f"EXTRACTION OF RAILS DATA IN {country} HAS ALREADY BEEN DONE")
-        
+
         # Station data from OSM
-        if os.path.exists(f"{fname_station_original}_{country}.geojson") == False: 
-            query_station = e.query_station(country)
-            e.info(f"EXTRACTION: DOWNLOADING STATION DATA IN {country}")
-            station_data = e.get_data(URL, query_station, 'Stations', country)
-            e.save_as_json_geojson(station_data, f"{fname_station_original}_{country}")
+        if e.raw_exists(f"{fname_station_original}_{country}") == False:
+            jobs.append(("station", e.query_station(country), 'Stations', country, f"{fname_station_original}_{country}"))
         else:
             e.info(f"EXTRACTION OF STATIONS DATA IN {country} HAS ALREADY BEEN DONE")
 
         # City data from OSM
-        if os.path.exists(f"{fname_city_original}_{country}.geojson") == False: 
-            query_city = e.query_city(country)
-            e.info(f"EXTRACTION: DOWNLOADING CITY DATA IN {country}")
-            city_data = e.get_data(URL, query_city, 'City', country)                
-            e.save_as_json_geojson(city_data, f"{fname_city_original}_{country}")
+        if e.raw_exists(f"{fname_city_original}_{country}") == False:
+            jobs.append(("city", e.query_city(country), 'City', country, f"{fname_city_original}_{country}"))
         else:
             e.info(f"EXTRACTION OF CITY DATA IN {country} HAS ALREADY BEEN DONE")
 
         # Heritage data from OSM
-        if os.path.exists(f"{fname_heri_original}_{country}.geojson") == False: 
-            query_heri = e.query_heritage(country)
-            e.info(f"EXTRACTION: DOWNLOADING HERITAGE DATA IN {country}")
-            heri_data = e.get_data(URL, query_heri, 'Heritage', country)
-            e.save_as_json_geojson(heri_data, f"{fname_heri_original}_{country}")
+        if e.raw_exists(f"{fname_heri_original}_{country}") == False:
+            jobs.append(("heri", e.query_heritage(country), 'Heritage', country, f"{fname_heri_original}_{country}"))
         else:
             e.info(f"EXTRACTION OF HERITAGE DATA IN {country} HAS ALREADY BEEN DONE")
 
         # Nature data from OSM
-        if os.path.exists(f"{fname_natu_original}_{country}.geojson") == False: 
-            query_natu = e.query_nature(country)
-            e.info(f"EXTRACTION: DOWNLOADING NATURE DATA IN {country}")
-            natu_data = e.get_data(URL, query_natu, 'Natural Parks', country)
-            e.save_as_json_geojson(natu_data, f"{fname_natu_original}_{country}")
+        if e.raw_exists(f"{fname_natu_original}_{country}") == False:
+            jobs.append(("natu", e.query_nature(country), 'Natural Parks', country, f"{fname_natu_original}_{country}"))
         else:
             e.info(f"EXTRACTION OF NATURE DATA IN {country} HAS ALREADY BEEN DONE")
 
-        e.info(f"EXTRACTION: COMPLETED IN {country}")
+    # download concurrently with a limited rate and save each result as soon as it is downloaded
+    if jobs != []:
+        scheduler = e.DownloadScheduler(URL, max_workers=DOWNLOAD_WORKERS, rate=DOWNLOAD_RATE, download_dir=DOWNLOAD_DIR)
+        # big countries are downloaded in tiles (an interrupted download resumes with the missing tiles)
+        tiled_countries = []
+        for country in countries:
+            filenames = {layer: fname for layer, _, _, job_country, fname in jobs if job_country == country}
+            if country in TILED_COUNTRIES and filenames != {}:
+                if e.download_tiles(scheduler, country, filenames, TILE_SIZE, f"{DOWNLOAD_DIR}/tiles_{country}", TILED_COUNTRIES[country]) == True:
+                    tiled_countries.append(country)
+        jobs = [job for job in jobs if job[3] not in tiled_countries]
+
+        if COMBINED_QUERY == True:
+            # one request per country, the response is split into the layers locally
+            country_jobs = []
+            for country in countries:
+                filenames = {layer: fname for layer, _, _, job_country, fname in jobs if job_country == country}
+                if filenames != {}:
+                    country_jobs.append((e.query_country(country, list(filenames)), 'All layers', country, filenames))
+            scheduler.download(country_jobs, e.save_layers, check=e.has_required_layers)
+        else:
+            scheduler.download([job[1:] for job in jobs], e.save_raw)
 
     e.info("EXTRACTION: COMPLETED")
 
 
-def network_preprocessing(countries: list) -> None:
-    """This function is based on the packages etl (trans.py) and routing (preprocessing.py). It transforms json data
-    and prepares a routable network. The data is stored as shapefiles in data/processed
+def convert_layer(country: str, layer: str) -> gpd.GeoDataFrame:
+    """This function is based on the package etl (trans.py). It converts the OSM JSON of one layer of a country to a
+    gpd.GeoDataFrame in the EPSG of the project
 
     Args:
-        countries (list): List of destination countries 
+        country (str): The country in international spelling
+        layer (str): "station", "rail", "city", "heri" or "natu"
+
+    Returns:
+        gpd.GeoDataFrame: The converted layer
     """
+    e.info(f"PREPROCSSING: DATA CONVERSION OF {layer} FOR {country} STARTED")
 
-    # create a string for country names to use in saving
-    countries = list(countries)
-    countries.sort()
-    fname_country = "_".join(countries)
+    if layer == "station":
+        layer_gdf = e.convert_in_chunks(e.raw_path(f"{fname_station_original}_{country}"), e.convert_to_gdf, COLUMNS_STAT, ['Point', 'MultiPoint'])
+        layer_gdf = e.reproject(layer_gdf, EPSG)
+        if country == 'Greece' or country == 'North Macedonia' or country == 'Bulgaria' or country == 'Serbia' or country == 'Montenegro':
+            layer_gdf["name"] = layer_gdf["name:en"]
 
-    # check if preprocessed data for the composition of countries exists already
-    if os.path.exists(f"data/processed/z_database/{fname_country}") == True:
-        e.info("PREPROCESSING HAS ALREADY BEEN DONE FOR THESE COUNTRIES")
-        e.info("GETTING DATA FOR THESE COUNTRIES FROM PREPROCESSING STORAGE")
-        # read and save the found combination in processed folder structure (like a update of processed/cites...)
-        station_all_gdf = gpd.read_file(f"data/processed/z_database/{fname_country}/station")
-        e.save_as_shp(station_all_gdf, fname_station_processed)
+    elif layer == "rail":
+        layer_gdf = e.convert_in_chunks(e.raw_path(f"{fname_rail_original}_{country}"), e.convert_to_gdf, COLUMNS_RAIL, ['LineString', 'MulitLineString'])
+        layer_gdf = e.reproject(layer_gdf, EPSG)
+        layer_gdf["country"] = country
 
-        rail_all_gdf = gpd.read_file(f"data/processed/z_database/{fname_country}/rail")
-        e.save_as_shp(rail_all_gdf, fname_rail_processed)
+    elif layer == "city":
+        layer_gdf = e.convert_in_chunks(e.raw_path(f"{fname_city_original}_{country}"), e.convert_to_gdf, COLUMNS_CITY, ['Point', 'MultiPoint'])
+        layer_gdf = e.reproject(layer_gdf, EPSG)
+        if country == 'Greece' or country == 'North Macedonia' or country == 'Bulgaria' or country == 'Serbia' or country == 'Montenegro':
+            layer_gdf["name"] = layer_gdf["name:en"]
 
-        city_all_gdf = gpd.read_file(f"data/processed/z_database/{fname_country}/city")
-        e.save_as_shp(city_all_gdf, fname_city_processed)
+    elif layer == "heri":
+        layer_gdf = e.convert_in_chunks(e.raw_path(f"{fname_heri_original}_{country}"), e.overpass_json_to_gpd_gdf, COLUMNS_HERI, ['Point', 'MultiPoint'])
+        layer_gdf = e.reproject(layer_gdf, EPSG)
 
-        heri_all_gdf = gpd.read_file(f"data/processed/z_database/{fname_country}/heri")
-        e.save_as_shp(heri_all_gdf, fname_heri_processed)
+    elif layer == "natu":
+        layer_gdf = e.convert_in_chunks(e.raw_path(f"{fname_natu_original}_{country}"), e.convert_to_gdf, COLUMNS_NATU, [])
+        layer_gdf = e.reproject(layer_gdf, EPSG)
+        layer_gdf = e.way_to_polygon(layer_gdf)
 
-        natu_all_gdf = gpd.read_file(f"data/processed/z_database/{fname_country}/natu")
-        e.save_as_shp(natu_all_gdf, fname_natu_processed)
+    else:
+        raise ValueError(f"Unknown layer: {layer}")
 
-        city_all_gdf = city_all_gdf[city_all_gdf.name  != "nan"]
-        all_cities_list = e.all_cities_list(city_all_gdf)
+    return layer_gdf
 
-        return all_cities_list
 
-    e.info("PREPROCESSING: STARTED")
+def preprocess_country(country: str, station_gdf: gpd.GeoDataFrame, rail_gdf: gpd.GeoDataFrame) -> tuple:
+    """This function is based on the package routing (preprocessing.py). It prepares the standalone routable network of
+    one country
 
-    # create general gpd.GeoDataFrame
-    rail_all_gdf = gpd.GeoDataFrame()
-    station_all_gdf = gpd.GeoDataFrame()
-    city_all_gdf = gpd.GeoDataFrame()
-    heri_all_gdf = gpd.GeoDataFrame()
-    natu_all_gdf = gpd.GeoDataFrame()
+    Args:
+        country (str): The country in international spelling
+        station_gdf (gpd.GeoDataFrame): The converted stations of the country
+        rail_gdf (gpd.GeoDataFrame): The converted rails of the country
 
-    for country in countries:  
+    Returns:
+        tuple: (station_gdf, rail_gdf) the snapped stations and the noded rail segments
+    """
+    # Preprocess data to make it routable
+    e.info(f"PREPROCESSING: START PREPARING ROUTABLE NETWORK FOR {country}")
+        # snap stations to rail
+    e.info(f"PREPROCESSING: SNAP STATIONS TO RAIL IN {country}")
+    station_gdf = r.snap_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=50)
+        # connect station for changing in rail_gdf
+    e.info(f"PREPROCESSING: CONNECTING STATIONS IN {country}")
+    rail_gdf = r.connect_points_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=500)
+        # split rails at nearest station
+    e.info(f"PREPROCESSING: SPLITTING TO SEGMENTS IN {country}")
+    rail_gdf = r.split_line_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=2)
+        # quantise the coordinates so that segments with nearly the same end points are connected
+    e.info(f"PREPROCESSING: NODING NETWORK IN {country}")
+    station_gdf, rail_gdf = r.node_network(point_gdf=station_gdf, line_gdf=rail_gdf, grid=NODING_GRID)
 
-        # Reading the .json files for rail, stations, city from the folder data/original
-        rail_json = e.open_json(f"{fname_rail_original}_{country}")
-        station_json = e.open_json(f"{fname_station_original}_{country}")
-        city_json = e.open_json(f"{fname_city_original}_{country}")
-        heri_json = e.open_json(f"{fname_heri_original}_{country}")
-        natu_json = e.open_json(f"{fname_natu_original}_{country}")
+    e.info(f"PREPROCESSING: COMPLETED FOR {country}")
 
-        # Convert the OSM JSON to a gpd.GeoDataFrame and store in the folder data/processed as shapefile
-        e.info(f"PREPROCSSING: DATA CONVERSION FOR {country} STARTED")
+    return station_gdf, rail_gdf
 
-        station_gdf = e.convert_to_gdf(station_json, COLUMNS_STAT, ['Point', 'MultiPoint'])
-        station_gdf = e.reproject(station_gdf, EPSG)
-        if country == 'Greece' or country == 'North Macedonia' or country == 'Bulgaria' or country == 'Serbia' or country == 'Montenegro':
-            station_gdf["name"] = station_gdf["name:en"]
-        station_all_gdf = station_all_gdf.append(station_gdf, ignore_index=True)
 
-        rail_gdf = e.convert_to_gdf(rail_json, COLUMNS_RAIL, ['LineString', 'MulitLineString'])
-        rail_gdf = e.reproject(rail_gdf, EPSG)
-        rail_all_gdf = rail_all_gdf.append(rail_gdf, ignore_index=True)
+def preprocess_countries(countries: list) -> None:
+    """This function preprocesses the countries in worker processes: first all layers of all countries are converted
+    in parallel, then the networks of the countries are prepared in parallel. The data of each country is stored with
+    the storage backend (etl/storage.py) in data/processed/z_database/{country}
 
-        city_gdf = e.convert_to_gdf(city_json, COLUMNS_CITY, ['Point', 'MultiPoint'])
-        city_gdf = e.reproject(city_gdf, EPSG)
-        if country == 'Greece' or country == 'North Macedonia' or country == 'Bulgaria' or country == 'Serbia' or country == 'Montenegro':
-            city_gdf["name"] = city_gdf["name:en"]
-        city_all_gdf = city_all_gdf.append(city_gdf, ignore_index=True)
+    Args:
+        countries (list): List of countries which are not preprocessed yet
+    """
+    tasks = [(country, layer) for country in countries for layer in LAYERS]
+    workers = max(1, min(PREPROCESSING_WORKERS, len(tasks)))
+    e.info(f"PREPROCESSING: {len(countries)} COUNTRIES IN {workers} WORKER PROCESSES")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # convert every layer of every country
+        layer_gdfs = dict(zip(tasks, pool.map(convert_layer, *zip(*tasks))))
+
+        # prepare the network of every country
+        networks = pool.map(preprocess_country, countries,
+                            [layer_gdfs[(country, "station")] for country in countries],
+                            [layer_gdfs[(country, "rail")] for country in countries])
+
+        for country, (station_gdf, rail_gdf) in zip(countries, networks):
+            # save with the storage backend
+            if os.path.exists(f"data/processed/z_database/{country}") == True:
+                shutil.rmtree(f"data/processed/z_database/{country}")
+            os.makedirs(f"data/processed/z_database/{country}")
+            e.save_gdf(station_gdf, f"data/processed/z_database/{country}/station", STORAGE_BACKEND)
+            e.save_gdf(rail_gdf, f"data/processed/z_database/{country}/rail_segments", STORAGE_BACKEND)
+            e.save_gdf(layer_gdfs[(country, "city")], f"data/processed/z_database/{country}/city", STORAGE_BACKEND)
+            e.save_gdf(layer_gdfs[(country, "heri")], f"data/processed/z_database/{country}/heri", STORAGE_BACKEND)
+            e.save_gdf(layer_gdfs[(country, "natu")], f"data/processed/z_database/{country}/natu", STORAGE_BACKEND)
+
+
+def read_countries(countries: list, layer: str) -> gpd.GeoDataFrame:
+    """Reads one layer of the preprocessed countries and merges them into one GeoDataFrame
 
-        heri_gdf = e.overpass_json_to_gpd_gdf(heri_json, COLUMNS_HERI, ['Point', 'MultiPoint'])
-        heri_gdf = e.reproject(heri_gdf, EPSG)
-        heri_all_gdf = heri_all_gdf.append(heri_gdf, ignore_index=True)
+    Args:
+        countries (list): List of preprocessed countries
+        layer (str): Name of the layer in data/processed/z_database/{country}
+
+    Returns:
+        gpd.GeoDataFrame: The layer of all countries
+    """
+    layer_gdfs = [e.read_gdf(f"data/processed/z_database/{country}/{layer}") for country in countries]
+    return gpd.GeoDataFrame(pd.concat(layer_gdfs, ignore_index=True), crs=EPSG)
+
+
+def network_preprocessing(countries: list) -> None:
+    """This function is based on the packages etl (trans.py) and routing (preprocessing.py). Every country is
+    preprocessed once to a standalone network, then the networks of the countries are merged and stitched at the
+    borders. The data is stored with the storage backend (etl/storage.py) in data/processed
+
+    Args:
+        countries (list): List of destination countries 
+    """
+
+    # create a string for country names to use in saving
+    countries = list(countries)
+    countries.sort()
+    fname_country = "_".join(countries)
 
-        natu_gdf = e.convert_to_gdf(natu_json, COLUMNS_NATU, [])
-        natu_gdf = e.reproject(natu_gdf, EPSG)
-        natu_gdf = e.way_to_polygon(natu_gdf)
-        natu_all_gdf = natu_all_gdf.append(natu_gdf, ignore_index=True)
+    # check if the composition of countries is already merged in data/processed
+    if os.path.exists(fname_countries_processed) == True and e.gdf_exists(fname_city_processed) == True:
+        with open(fname_countries_processed) as file:
+            if file.read() == fname_country:
+                e.info("PREPROCESSING HAS ALREADY BEEN DONE FOR THESE COUNTRIES")
+                city_all_gdf = e.read_gdf(fname_city_processed, columns=["name"])
+                city_all_gdf = city_all_gdf[city_all_gdf.name  != "nan"]
+                return e.all_cities_list(city_all_gdf)
+        os.remove(fname_countries_processed)
 
+    e.info("PREPROCESSING: STARTED")
+
+    # preprocess the countries which are not in the preprocessing storage yet
+    missing_countries = []
+    for country in countries:
+        if e.gdf_exists(f"data/processed/z_database/{country}/rail_segments") == True:
+            e.info(f"PREPROCESSING HAS ALREADY BEEN DONE FOR {country}")
+        else:
+            missing_countries.append(country)
+    if missing_countries != []:
+        preprocess_countries(missing_countries)
+
+    # merge the networks of the countries
+    e.info("PREPROCESSING: MERGING COUNTRIES")
+    station_all_gdf = read_countries(countries, "station")
+    rail_all_gdf = read_countries(countries, "rail_segments")
+    city_all_gdf = read_countries(countries, "city")
+    heri_all_gdf = read_countries(countries, "heri")
+    natu_all_gdf = read_countries(countries, "natu")
     e.info("PREPROCSSING: MERGED ALL COUNTRIES")
 
-    # Preprocess data to make it routable
-    e.info("PREPROCESSING: START PREPARING ROUTABLE NETWORK")
-        # snap stations to rail
-    e.info("PREPROCESSING: SNAP STATIONS TO RAIL")
-    station_all_gdf = r.snap_spatial_index(point_gdf=station_all_gdf, line_gdf=rail_all_gdf, offset=50)
-        # connect station for changing in rail_gdf
-    e.info("PREPROCESSING: CONNECTING STATIONS")
-    rail_all_gdf = r.connect_points_spatial_index(point_gdf=station_all_gdf, line_gdf=rail_all_gdf, offset=500)
-        # split rails at nearest station
-    e.info("PREPROCESSING: SPLITTING TO SEGMENTS")
-    rail_all_gdf = r.split_line_spatial_index(point_gdf=station_all_gdf, line_gdf=rail_all_gdf, offset=2)
+    # Stitch the networks of the countries
+    e.info("PREPROCESSING: STITCHING COUNTRIES AT THE BORDERS")
+        # connect stations across the borders, split the border rails at the stations of all countries and node them
+    station_all_gdf, rail_all_gdf = r.stitch_networks(point_gdf=station_all_gdf, line_gdf=rail_all_gdf, grid=NODING_GRID)
+        # merge the segments between stations, junctions and borders
+    rail_segments_gdf = None
+    if SIMPLIFY_NETWORK == True:
+        e.info("PREPROCESSING: SIMPLIFYING NETWORK")
+        rail_all_gdf, rail_segments_gdf = r.simplify_network(point_gdf=station_all_gdf, line_gdf=rail_all_gdf)
+        # label the connected components of the network for the stations
+    e.info("PREPROCESSING: LABELLING CONNECTED COMPONENTS")
+    station_all_gdf = r.label_components(point_gdf=station_all_gdf, line_gdf=rail_all_gdf)
+        # link the cities to their nearest stations
+    e.info("PREPROCESSING: LINKING CITIES TO STATIONS")
+    link_all_gdf = r.link_city_station(city_gdf=city_all_gdf, station_gdf=station_all_gdf, k=3)
     e.info("PREPROCESSING: ROUTABLE NETWORK COMPLETED")
 
-    # save as shapefiles
-    os.makedirs(f"data/processed/z_database/{fname_country}")
-    e.save_as_shp(station_all_gdf, f"data/processed/z_database/{fname_country}/station")
-    e.save_as_shp(station_all_gdf, fname_station_processed)
-    e.save_as_shp(rail_all_gdf, f"data/processed/z_database/{fname_country}/rail")
-    e.save_as_shp(rail_all_gdf, fname_rail_processed)
-    e.save_as_shp(city_all_gdf, f"data/processed/z_database/{fname_country}/city")
-    e.save_as_shp(city_all_gdf, fname_city_processed)
-    e.save_as_shp(heri_all_gdf, f"data/processed/z_database/{fname_country}/heri")
-    e.save_as_shp(heri_all_gdf, fname_heri_processed)
-    e.save_as_shp(natu_all_gdf, f"data/processed/z_database/{fname_country}/natu")
-    e.save_as_shp(natu_all_gdf, fname_natu_processed)
+    # save with the storage backend
+    e.save_gdf(station_all_gdf, fname_station_processed, STORAGE_BACKEND)
+    e.save_gdf(rail_all_gdf, fname_rail_processed, STORAGE_BACKEND)
+    e.remove_gdf(fname_segments_processed)
+    if rail_segments_gdf is not None:
+        e.save_gdf(rail_segments_gdf, fname_segments_processed, STORAGE_BACKEND)
+    e.save_gdf(city_all_gdf, fname_city_processed, STORAGE_BACKEND)
+    e.save_gdf(heri_all_gdf, fname_heri_processed, STORAGE_BACKEND)
+    e.save_gdf(natu_all_gdf, fname_natu_processed, STORAGE_BACKEND)
+    e.save_gdf(link_all_gdf, fname_link_processed, STORAGE_BACKEND)
+
+    # optional: contraction hierarchy for fast station to station queries, saved next to the processed data
+    if os.path.exists(f"{fname_ch_processed}.npz") == True:
+        os.remove(f"{fname_ch_processed}.npz")
+    if ROUTING_ENGINE == "ch":
+        e.info("PREPROCESSING: BUILDING CONTRACTION HIERARCHY")
+        contraction_hierarchy = r.build_contraction_hierarchy(r.CsrEngine(rail_all_gdf))
+        r.save_contraction_hierarchy(contraction_hierarchy, fname_ch_processed, r.network_fingerprint(e.gdf_path(fname_rail_processed)))
+
+    # remember the composition of countries in data/processed
+    with open(fname_countries_processed, "w") as file:
+        file.write(fname_country)
 
     e.info("PREPROCESSING: COMPLETED")
 
@@ -227,7 +357,7 @@ def network_preprocessing(countries: list) -> None:
 
 def routing(list_input_city: list):
     """This function is based on the package routing. It finds the best route between the input cities and corresponding
-    cultural sites, nature parks and close cities on the way. Everything is saved as shapefiles in data/route
+    cultural sites, nature parks and close cities on the way. Everything is saved with the storage backend in data/route
 
     Args:
         list_input_city (list): List of input cities
@@ -239,47 +369,52 @@ def routing(list_input_city: list):
     else:
         os.makedirs("data/route")
 
-    # Open shapefiles as GeoDataFrames
-    city_gdf = gpd.read_file(fname_city_processed)
-    station_gdf = gpd.read_file(fname_station_processed)   
-    rail_gdf = gpd.read_file(fname_rail_processed)
-    heri_gdf = gpd.read_file(fname_heri_processed)
-    natu_gdf = gpd.read_file(fname_natu_processed)
+    # Open the processed data as GeoDataFrames
+    city_gdf = e.read_gdf(fname_city_processed)
+    station_gdf = e.read_gdf(fname_station_processed)
+    heri_gdf = e.read_gdf(fname_heri_processed)
+    natu_gdf = e.read_gdf(fname_natu_processed)
 
     # connecting the input city list to the nearest station
-    gdf_input_stations = r.city_to_station(city_gdf, station_gdf, list_input_city)
+    link_gdf = None
+    if e.gdf_exists(fname_link_processed) == True:
+        link_gdf = e.read_gdf(fname_link_processed)
+    gdf_input_stations = r.city_to_station(city_gdf, station_gdf, list_input_city, gdf_link=link_gdf)
+
+    # building the graph of the rail network (kept in memory as long as the preprocessed network does not change)
+    network = r.load_network(fname_rail_processed, engine=ROUTING_ENGINE, fname_ch=fname_ch_processed, cache_dir=CACHE_DIR)
 
     e.info("ROUTING: SOLVING TSP STARTED")
     # solving the travelling sales man problem ("TSP")
-    dict_distance_matrix = r.create_distance_matrix(gdf_input_stations, rail_gdf, mirror_matrix=True)
+    dict_distance_matrix = r.create_distance_matrix(gdf_input_stations, network, mirror_matrix=True, one_to_many=ONE_TO_MANY, workers=WORKERS)
     # if no path could be found return the error city 
     if "error_city" in dict_distance_matrix.keys():
         return dict_distance_matrix
 
-    plan_output = r.tsp_calculation(dict_distance_matrix)
+    tsp_result = r.tsp_calculation(dict_distance_matrix, solver=TSP_SOLVER, time_limit=TSP_TIME_LIMIT)
 
-    # create GeoDataFrame ot of the plan_output
-    best_route = r.merge_tsp_solution(dict_distance_matrix, plan_output, crs=EPSG)
+    # create GeoDataFrame ot of the tsp_result
+    best_route = r.merge_tsp_solution(dict_distance_matrix, tsp_result, crs=EPSG)
     e.info("ROUTING: SOLVING TSP COMPLETED")
     
-    e.save_as_shp(best_route, 'data/route/best_route')
+    e.save_gdf(best_route, 'data/route/best_route', STORAGE_BACKEND)
 
     # select cities in proximity
     close_cities = r.features_on_way(city_gdf, best_route, list_input_city, 5000, crs=EPSG)
     try:
-        e.save_as_shp(close_cities, 'data/route/close_cities')
+        e.save_gdf(close_cities, 'data/route/close_cities', STORAGE_BACKEND)
     except: e.info("no close cities on your best route")
 
     # select heritages in proximity
     close_heris = r.features_on_way(heri_gdf, best_route, [], 5000, crs=EPSG)
     try:
-        e.save_as_shp(close_heris, 'data/route/close_heris')
+        e.save_gdf(close_heris, 'data/route/close_heris', STORAGE_BACKEND)
     except: e.info("no close heritage sites on your best route")
 
     # select nature in proximity
     close_natus = r.features_on_way(natu_gdf, best_route, [], 20000, crs=EPSG)
     try:
-        e.save_as_shp(close_natus, 'data/route/close_natus')
+        e.save_gdf(close_natus, 'data/route/close_natus', STORAGE_BACKEND)
     except: e.info("no close natural parks on your best route")
 
     return dict_distance_matrix
\ No newline at end of file
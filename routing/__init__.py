@@ -1,4 +1,9 @@
 from etl.logs import die, info, done, init_logger
-from .preprocessing import snap_spatial_index, connect_points_spatial_index, split_line_spatial_index
-from .tsp import city_to_station, shortest_path, create_distance_matrix, tsp_calculation
+from .engine import NetworkxEngine, CsrEngine, ChEngine, ENGINES, load_network
+from .cache import network_fingerprint, PathCache, CachedEngine
+from .contraction import build_contraction_hierarchy, save_contraction_hierarchy, load_contraction_hierarchy
+from .parallel import parallel_shortest_paths
+from .preprocessing import snap_spatial_index, connect_points_spatial_index, split_line_spatial_index, node_network, stitch_networks, simplify_network, label_components, link_city_station
+from .tsp_solvers import TspResult, held_karp, ortools_tsp, two_opt, solve_tsp
+from .tsp import nearest_stations, city_to_station, shortest_path, unreachable_city, one_to_many_matrices, create_distance_matrix, tsp_calculation
 from .post_routing import merge_tsp_solution, features_on_way
\ No newline at end of file
@@ -0,0 +1,190 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+import shapely.wkb
+import shapely.geometry as sg
+import etl as e
+
+
+def network_fingerprint(fname_rail: str) -> str:
+    """This function creates a fingerprint of the preprocessed rail network from the content of its files. It changes
+    whenever the network is preprocessed again with a different result
+
+    Args:
+        fname_rail (str): Filename of the stored rail network (file or directory of a shapefile)
+
+    Returns:
+        str: sha1 hash of the files
+    """
+    if os.path.isdir(fname_rail):
+        fnames = [os.path.join(fname_rail, fname) for fname in sorted(os.listdir(fname_rail))]
+    else:
+        fnames = [fname_rail]
+
+    fingerprint = hashlib.sha1()
+    for fname in fnames:
+        fingerprint.update(os.path.basename(fname).encode())
+        with open(fname, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                fingerprint.update(chunk)
+
+    return fingerprint.hexdigest()
+
+
+def _station_key(node) -> str:
+    """Creates the key of a station from its node coordinates"""
+    return f"{node[0]:.3f} {node[1]:.3f}"
+
+
+class PathCache:
+    """Cache for shortest paths with an in-memory LRU in front of a sqlite file. The entries are keyed by
+    (network fingerprint, origin station, destination station), so a rebuilt network never gets old paths
+
+    Args:
+        directory (str): Directory of the sqlite file
+        fingerprint (str): Fingerprint of the rail network by def network_fingerprint
+        max_memory (int): Maximum number of paths in memory
+        max_disk (int): Maximum number of paths in the sqlite file, the least recently used ones are deleted
+    """
+
+    def __init__(self, directory: str, fingerprint: str, max_memory: int = 1000, max_disk: int = 100000):
+        self.fingerprint = fingerprint
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, "paths.sqlite"), check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS paths (
+            fingerprint TEXT, origin TEXT, destination TEXT, distance REAL, path BLOB, last_used REAL,
+            PRIMARY KEY (fingerprint, origin, destination))""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS paths_last_used ON paths (last_used)")
+        self.connection.commit()
+
+    def _remember(self, key: tuple, path: sg.LineString) -> None:
+        """Puts a path in the in-memory LRU and removes the least recently used one if it is full"""
+        self.memory[key] = path
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+
+    def get(self, origin, destination) -> sg.LineString:
+        """Returns the cached path between two station nodes or None. A path cached in the other direction is
+        returned reversed
+
+        Args:
+            origin (tuple): Node of the origin station
+            destination (tuple): Node of the destination station
+
+        Returns:
+            shapely.LineString: The cached path or None
+        """
+        origin_key, destination_key = _station_key(origin), _station_key(destination)
+        with self.lock:
+            if (origin_key, destination_key) in self.memory:
+                self.memory.move_to_end((origin_key, destination_key))
+                return self.memory[(origin_key, destination_key)]
+            if (destination_key, origin_key) in self.memory:
+                self.memory.move_to_end((destination_key, origin_key))
+                return sg.LineString(list(self.memory[(destination_key, origin_key)].coords)[::-1])
+
+            for key, reverse in (((origin_key, destination_key), False), ((destination_key, origin_key), True)):
+                row = self.connection.execute("SELECT path FROM paths WHERE fingerprint = ? AND origin = ? AND destination = ?",
+                                              (self.fingerprint, key[0], key[1])).fetchone()
+                if row is not None:
+                    self.connection.execute("UPDATE paths SET last_used = ? WHERE fingerprint = ? AND origin = ? AND destination = ?",
+                                            (time.time(), self.fingerprint, key[0], key[1]))
+                    self.connection.commit()
+                    path = shapely.wkb.loads(bytes(row[0]))
+                    self._remember(key, path)
+                    if reverse:
+                        return sg.LineString(list(path.coords)[::-1])
+                    return path
+
+        return None
+
+    def put(self, origin, destination, path: sg.LineString) -> None:
+        """Stores the path between two station nodes in memory and in the sqlite file
+
+        Args:
+            origin (tuple): Node of the origin station
+            destination (tuple): Node of the destination station
+            path (shapely.LineString): The shortest path
+        """
+        key = (_station_key(origin), _station_key(destination))
+        with self.lock:
+            self._remember(key, path)
+            self.connection.execute("INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?, ?, ?)",
+                                    (self.fingerprint, key[0], key[1], path.length, path.wkb, time.time()))
+            # size bounded: delete the least recently used paths (of any network)
+            self.connection.execute("""DELETE FROM paths WHERE rowid IN (SELECT rowid FROM paths ORDER BY last_used DESC
+                                       LIMIT -1 OFFSET ?)""", (self.max_disk,))
+            self.connection.commit()
+
+
+class CachedEngine:
+    """Routing engine which answers the shortest path queries from a PathCache and only asks the wrapped routing
+    engine for the paths which are not cached yet
+
+    Args:
+        network: The routing engine (NetworkxEngine, CsrEngine or ChEngine)
+        cache (PathCache): The cache for the paths of this rail network
+    """
+
+    def __init__(self, network, cache: PathCache):
+        self.network = network
+        self.cache = cache
+
+    def station_node(self, station_point: sg.Point):
+        """Returns the node of a (snapped) station point of the wrapped routing engine"""
+        return self.network.station_node(station_point)
+
+    def shortest_path(self, start_node, end_node) -> sg.LineString:
+        """Returns the shortest path between two nodes from the cache or calculates and caches it
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_node (tuple): The node of the end station
+
+        Returns:
+            shapely.LineString: Shortest path in LineString geometry
+        """
+        path = self.cache.get(start_node, end_node)
+        if path is None:
+            path = self.network.shortest_path(start_node, end_node)
+            self.cache.put(start_node, end_node, path)
+
+        return path
+
+    def shortest_paths(self, start_node, end_nodes: list) -> dict:
+        """Returns the shortest paths from one start node to many end nodes. Only the paths which are not cached
+        are calculated (with one search of the wrapped routing engine)
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_nodes (list): The nodes of the end stations
+
+        Returns:
+            dict: {end_node: shapely.LineString} for every end node which can be reached from the start node
+        """
+        paths = {}
+        missing = []
+        for end_node in end_nodes:
+            path = self.cache.get(start_node, end_node) if end_node != start_node else None
+            if path is None:
+                missing.append(end_node)
+            else:
+                paths[end_node] = path
+
+        if missing != []:
+            e.info(f"ROUTING: {len(paths)} PATHS FROM CACHE, SEARCHING {len(missing)} PATHS")
+            new_paths = self.network.shortest_paths(start_node, missing)
+            for end_node, path in new_paths.items():
+                self.cache.put(start_node, end_node, path)
+            paths.update(new_paths)
+
+        return paths
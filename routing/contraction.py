@@ -0,0 +1,172 @@
+import heapq
+import numpy as np
+import etl as e
+
+
+def _witness_distances(adjacency: list, source: int, excluded: int, targets: set, max_cost: float, max_settled: int) -> dict:
+    """Local Dijkstra search for the contraction of a node. It looks for paths (witnesses) between two neighbours of
+    the contracted node which do not pass the contracted node
+
+    Args:
+        adjacency (list): Adjacency of the remaining graph [{neighbour: (weight, middle, segment)}]
+        source (int): The neighbour where the search starts
+        excluded (int): The node which is contracted
+        targets (set): The other neighbours of the contracted node
+        max_cost (float): The search stops at this cost
+        max_settled (int): The search stops after this number of settled nodes
+
+    Returns:
+        dict: {node: distance} for the nodes found by the search
+    """
+    distances = {source: 0.0}
+    remaining = set(targets)
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and remaining and settled < max_settled:
+        cost, node = heapq.heappop(heap)
+        if cost > distances[node]:
+            continue
+        if cost > max_cost:
+            break
+        settled += 1
+        remaining.discard(node)
+        for neighbour, edge in adjacency[node].items():
+            if neighbour == excluded:
+                continue
+            new_cost = cost + edge[0]
+            if neighbour not in distances or new_cost < distances[neighbour]:
+                distances[neighbour] = new_cost
+                heapq.heappush(heap, (new_cost, neighbour))
+
+    return distances
+
+
+def _shortcuts(adjacency: list, node: int, max_settled: int) -> list:
+    """Finds the shortcuts which are needed to keep all shortest paths when the node is contracted
+
+    Returns:
+        list: [(neighbour1, neighbour2, weight)] of the shortcuts
+    """
+    neighbours = list(adjacency[node].items())
+    shortcuts = []
+    for i, (u, edge_u) in enumerate(neighbours[:-1]):
+        targets = {w for w, _ in neighbours[i + 1:]}
+        max_cost = edge_u[0] + max(edge_w[0] for _, edge_w in neighbours[i + 1:])
+        distances = _witness_distances(adjacency, u, node, targets, max_cost, max_settled)
+        for w, edge_w in neighbours[i + 1:]:
+            via_node = edge_u[0] + edge_w[0]
+            if distances.get(w, np.inf) > via_node:
+                shortcuts.append((u, w, via_node))
+
+    return shortcuts
+
+
+def build_contraction_hierarchy(network, max_settled: int = 50) -> dict:
+    """This function builds a contraction hierarchy on the CSR arrays of a rail network. The nodes are contracted one
+    after another (least important first, by the edge difference) and shortcuts are inserted between their neighbours
+    when no other path of the same length exists. Afterwards each edge is stored at its lower ranked node, so that a
+    query only needs to search upwards from the start and end node
+
+    Args:
+        network (CsrEngine): The routing engine containing the CSR arrays of the rail network
+        max_settled (int): Maximum number of settled nodes in the witness searches
+
+    Returns:
+        dict: numpy arrays of the hierarchy
+                1. "rank": contraction order of every node
+                2. "up_indptr", "up_indices": the upward edges of node i are up_indices[up_indptr[i]:up_indptr[i+1]]
+                3. "up_weights": length of every upward edge
+                4. "up_middle": contracted node of a shortcut (-1 for original edges)
+                5. "up_segment": rail segment of an original edge (-1 for shortcuts)
+                6. "n_nodes", "n_segments": size of the network for checking that it fits to the rail data
+    """
+    n_nodes = len(network.indptr) - 1
+    indptr, indices = network.indptr.tolist(), network.indices.tolist()
+    lengths, segments = network.lengths.tolist(), network.edge_segment.tolist()
+
+    # adjacency of the remaining graph [{neighbour: (weight, middle, segment)}]
+    adjacency = [{} for _ in range(n_nodes)]
+    for u in range(n_nodes):
+        for position in range(indptr[u], indptr[u + 1]):
+            adjacency[u][indices[position]] = (float(lengths[position]), -1, segments[position])
+
+    contracted_neighbours = [0] * n_nodes
+
+    def priority(node):
+        shortcuts = _shortcuts(adjacency, node, max_settled) if len(adjacency[node]) > 1 else []
+        return len(shortcuts) - len(adjacency[node]) + contracted_neighbours[node]
+
+    heap = [(priority(node), node) for node in range(n_nodes)]
+    heapq.heapify(heap)
+
+    rank = np.zeros(n_nodes, dtype=np.int32)
+    upward = [None] * n_nodes
+    n_shortcuts = 0
+    n_contracted = 0
+    while heap:
+        _, node = heapq.heappop(heap)
+        # lazy update: contract the node only if it is still the least important one
+        new_priority = priority(node)
+        if heap and new_priority > heap[0][0]:
+            heapq.heappush(heap, (new_priority, node))
+            continue
+
+        if len(adjacency[node]) > 1:
+            for u, w, weight in _shortcuts(adjacency, node, max_settled):
+                if w not in adjacency[u] or adjacency[u][w][0] > weight:
+                    adjacency[u][w] = (weight, node, -1)
+                    adjacency[w][u] = (weight, node, -1)
+                    n_shortcuts += 1
+
+        # the remaining edges of the node lead to higher ranked nodes
+        upward[node] = adjacency[node]
+        for neighbour in adjacency[node]:
+            del adjacency[neighbour][node]
+            contracted_neighbours[neighbour] += 1
+        adjacency[node] = {}
+
+        rank[node] = n_contracted
+        n_contracted += 1
+        if n_contracted % max(1, n_nodes // 10) == 0:
+            e.info(f"PREPROCESSING: CONTRACTED {n_contracted} OF {n_nodes} NODES")
+
+    up_indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum([len(edges) for edges in upward], out=up_indptr[1:])
+    up_indices = np.array([v for edges in upward for v in edges], dtype=np.int32)
+    up_weights = np.array([edge[0] for edges in upward for edge in edges.values()], dtype=np.float64)
+    up_middle = np.array([edge[1] for edges in upward for edge in edges.values()], dtype=np.int32)
+    up_segment = np.array([edge[2] for edges in upward for edge in edges.values()], dtype=np.int32)
+
+    e.info(f"PREPROCESSING: CONTRACTION HIERARCHY WITH {n_shortcuts} SHORTCUTS COMPLETED")
+
+    return {"rank": rank, "up_indptr": up_indptr, "up_indices": up_indices, "up_weights": up_weights,
+            "up_middle": up_middle, "up_segment": up_segment,
+            "n_nodes": np.array(n_nodes), "n_segments": np.array(len(network.geometries))}
+
+
+def save_contraction_hierarchy(hierarchy: dict, fname: str, fingerprint: str = None) -> None:
+    """This function saves the arrays of a contraction hierarchy in a compressed numpy file
+
+    Args:
+        hierarchy (dict): The contraction hierarchy by def build_contraction_hierarchy
+        fname (str): Filename without file extension
+        fingerprint (str): Fingerprint of the rail network file (def network_fingerprint), saved as "fingerprint" to
+            recognise a hierarchy of another network
+    """
+    if fingerprint is not None:
+        hierarchy = dict(hierarchy, fingerprint=np.array(fingerprint))
+    np.savez_compressed(f"{fname}.npz", **hierarchy)
+
+
+def load_contraction_hierarchy(fname: str) -> dict:
+    """This function loads the arrays of a contraction hierarchy
+
+    Args:
+        fname (str): Filename without file extension
+
+    Returns:
+        dict: The contraction hierarchy like by def build_contraction_hierarchy
+    """
+    with np.load(f"{fname}.npz") as data:
+        hierarchy = {key: data[key] for key in data.files}
+    return hierarchy
@@ -0,0 +1,526 @@
+import os
+import math
+import heapq
+import shapely.geometry as sg
+import geopandas as gpd
+import numpy as np
+import networkx as nx
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+import momepy
+import etl as e
+from .cache import network_fingerprint, PathCache, CachedEngine
+from .contraction import build_contraction_hierarchy, save_contraction_hierarchy, load_contraction_hierarchy
+
+
+class NetworkxEngine:
+    """Routing engine which builds the networkx graph of the rail network once and answers all shortest path
+    queries from it. The edges are weighted by the length of the rail segments (momepy column "mm_len" in meters)
+
+    Args:
+        rail_segments_gdf (gpd.GeoDataFrame): The preprocessed GeoDataFrame containing the rail network
+    """
+
+    def __init__(self, rail_segments_gdf: gpd.GeoDataFrame):
+        # Create network from the rails GeoDataFrame
+        self.graph = momepy.gdf_to_nx(rail_segments_gdf, approach='primal', length='mm_len')
+        e.info(f"ROUTING: GRAPH CREATED WITH {self.graph.number_of_nodes()} NODES AND {self.graph.number_of_edges()} EDGES")
+
+    def station_node(self, station_point: sg.Point):
+        """Returns the graph node of a (snapped) station point
+
+        Args:
+            station_point (sg.Point): The geometry of the station
+
+        Returns:
+            tuple: The node key in the graph (coordinates of the station)
+        """
+        return station_point.coords[0]
+
+    def _search(self, start_node, end_nodes: list, heuristic=None) -> tuple:
+        """Searches the graph from the start node with the segment lengths as costs until all end nodes are settled.
+        Without heuristic this is Dijkstra Algorithm, with heuristic it is A* (only for a single end node)
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_nodes (list): The nodes of the end stations
+            heuristic (function): Optional function node -> estimated remaining distance to the end node
+
+        Returns:
+            tuple: (predecessors, settled) the predecessor tree {node: previous node} and the set of settled nodes
+        """
+        if start_node not in self.graph:
+            raise nx.NodeNotFound(f"Start station {start_node} is not in the rail network")
+
+        remaining = set(end_nodes)
+        costs = {start_node: 0}
+        predecessors = {start_node: None}
+        settled = set()
+        counter = 0 # tie breaker so that the node tuples are never compared in the heap
+        heap = [(0, counter, start_node)]
+        while heap and remaining:
+            _, _, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            for neighbour, edges in self.graph[node].items():
+                # take the shortest one of parallel segments
+                new_cost = costs[node] + min(edge['mm_len'] for edge in edges.values())
+                if neighbour not in costs or new_cost < costs[neighbour]:
+                    costs[neighbour] = new_cost
+                    predecessors[neighbour] = node
+                    counter += 1
+                    if heuristic is None:
+                        heapq.heappush(heap, (new_cost, counter, neighbour))
+                    else:
+                        heapq.heappush(heap, (new_cost + heuristic(neighbour), counter, neighbour))
+
+        return predecessors, settled
+
+    def _path_geometry(self, predecessors: dict, end_node) -> sg.LineString:
+        """Creates the geometry of a path by walking back the predecessor tree and joining the segment geometries
+
+        Args:
+            predecessors (dict): The predecessor tree of a search
+            end_node (tuple): The node of the end station
+
+        Returns:
+            shapely.LineString: The path following the rail segments from the start node to the end node
+        """
+        nodes = [end_node]
+        while predecessors[nodes[-1]] is not None:
+            nodes.append(predecessors[nodes[-1]])
+        nodes.reverse()
+
+        coords = [nodes[0]]
+        for u, v in zip(nodes[:-1], nodes[1:]):
+            edge = min(self.graph[u][v].values(), key=lambda edge: edge['mm_len'])
+            segment = list(edge['geometry'].coords)
+            # turn the segment if it is digitized in the other direction
+            if segment[0] != u:
+                segment.reverse()
+            coords.extend(segment[1:])
+
+        return sg.LineString(coords)
+
+    def shortest_path(self, start_node, end_node) -> sg.LineString:
+        """Calculates the shortest path between two nodes with A* Algorithm. The heuristic is the straight-line
+        distance to the end node in the projected coordinates
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_node (tuple): The node of the end station
+
+        Returns:
+            shapely.LineString: Shortest path in LineString geometry
+        """
+        def euclidean_distance(node):
+            return math.hypot(node[0] - end_node[0], node[1] - end_node[1])
+
+        predecessors, settled = self._search(start_node, [end_node], heuristic=euclidean_distance)
+        if end_node not in settled:
+            raise nx.NetworkXNoPath(f"No path between {start_node} and {end_node}")
+
+        return self._path_geometry(predecessors, end_node)
+
+    def shortest_paths(self, start_node, end_nodes: list) -> dict:
+        """Calculates the shortest paths from one start node to many end nodes with a single Dijkstra search. The
+        search stops as soon as all end nodes are settled and the paths are taken from its predecessor tree
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_nodes (list): The nodes of the end stations
+
+        Returns:
+            dict: {end_node: shapely.LineString} for every end node which can be reached from the start node
+        """
+        if start_node not in self.graph:
+            return {}
+        predecessors, settled = self._search(start_node, end_nodes)
+
+        # Walk back the predecessor tree for every settled end node
+        paths = {}
+        for end_node in end_nodes:
+            if end_node != start_node and end_node in settled:
+                paths[end_node] = self._path_geometry(predecessors, end_node)
+
+        return paths
+
+
+class CsrEngine:
+    """Routing engine which stores the rail network in compressed sparse row (CSR) arrays and answers the shortest
+    path queries with the Dijkstra Algorithm of scipy. Compared to the networkx graph it needs only a few arrays:
+        - node_coords (float64, n x 2): coordinates of the nodes, sorted, the node id is the row
+        - indptr, indices (int32): the neighbours of node i are indices[indptr[i]:indptr[i+1]]
+        - lengths (float32): length of the rail segment for each entry in indices
+        - edge_segment (int32): row of the rail segment in the GeoDataFrame for each entry in indices
+
+    Args:
+        rail_segments_gdf (gpd.GeoDataFrame): The preprocessed GeoDataFrame containing the rail network
+    """
+
+    def __init__(self, rail_segments_gdf: gpd.GeoDataFrame):
+        self.geometries = rail_segments_gdf.geometry.values
+        start_coords = np.array([line.coords[0][:2] for line in self.geometries], dtype=np.float64).reshape(-1, 2)
+        end_coords = np.array([line.coords[-1][:2] for line in self.geometries], dtype=np.float64).reshape(-1, 2)
+        segment_lengths = np.array([line.length for line in self.geometries], dtype=np.float64)
+
+        # Number the nodes: the same coordinates are the same node (like in momepy primal graphs)
+        self.node_coords, node_ids = np.unique(np.vstack([start_coords, end_coords]), axis=0, return_inverse=True)
+        node_ids = node_ids.reshape(-1).astype(np.int32)
+        n_segments = len(self.geometries)
+        start_ids, end_ids = node_ids[:n_segments], node_ids[n_segments:]
+
+        # Both directions of each segment without loops
+        segment_index = np.arange(n_segments, dtype=np.int32)
+        no_loop = start_ids != end_ids
+        rows = np.concatenate([start_ids[no_loop], end_ids[no_loop]])
+        cols = np.concatenate([end_ids[no_loop], start_ids[no_loop]])
+        lengths = np.concatenate([segment_lengths[no_loop], segment_lengths[no_loop]])
+        segments = np.concatenate([segment_index[no_loop], segment_index[no_loop]])
+
+        # Keep only the shortest of parallel segments, because scipy would add up their lengths
+        order = np.lexsort((lengths, cols, rows))
+        rows, cols, lengths, segments = rows[order], cols[order], lengths[order], segments[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, lengths, segments = rows[first], cols[first], lengths[first], segments[first]
+
+        n_nodes = len(self.node_coords)
+        self.indptr = np.zeros(n_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=self.indptr[1:])
+        self.indices = cols.astype(np.int32)
+        # explicit zeros are not treated as edges by scipy, so a zero length segment gets a minimal length
+        self.lengths = np.maximum(lengths, 1e-3).astype(np.float32)
+        self.edge_segment = segments.astype(np.int32)
+        # the sparse matrix of scipy on the same arrays, built once for all searches
+        self.csgraph = csr_matrix((self.lengths, self.indices, self.indptr), shape=(n_nodes, n_nodes))
+
+        e.info(f"ROUTING: CSR GRAPH CREATED WITH {n_nodes} NODES AND {len(self.indices) // 2} EDGES")
+
+    def station_node(self, station_point: sg.Point):
+        """Returns the node of a (snapped) station point
+
+        Args:
+            station_point (sg.Point): The geometry of the station
+
+        Returns:
+            tuple: The node key (coordinates of the station)
+        """
+        return station_point.coords[0][:2]
+
+    def _node_id(self, node) -> int:
+        """Returns the node id of a node key or -1 if it is not in the rail network"""
+        # node_coords is sorted by x and then y
+        lower = np.searchsorted(self.node_coords[:, 0], node[0], side='left')
+        upper = np.searchsorted(self.node_coords[:, 0], node[0], side='right')
+        matches = np.nonzero(self.node_coords[lower:upper, 1] == node[1])[0]
+        if len(matches) == 0:
+            return -1
+        return int(lower + matches[0])
+
+    def _search(self, start_id: int) -> np.ndarray:
+        """Runs the Dijkstra Algorithm of scipy from the start node over the CSR arrays
+
+        Returns:
+            np.ndarray: predecessor of every node (-9999 if it is not reachable)
+        """
+        _, predecessors = dijkstra(self.csgraph, directed=True, indices=start_id, return_predecessors=True)
+        return predecessors
+
+    def _path_geometry(self, predecessors: np.ndarray, end_id: int) -> sg.LineString:
+        """Creates the geometry of a path by walking back the predecessor array and joining the segment geometries
+
+        Args:
+            predecessors (np.ndarray): The predecessor array of a search
+            end_id (int): The node id of the end station
+
+        Returns:
+            shapely.LineString: The path following the rail segments from the start node to the end node
+        """
+        node_ids = [end_id]
+        while predecessors[node_ids[-1]] >= 0:
+            node_ids.append(int(predecessors[node_ids[-1]]))
+        node_ids.reverse()
+
+        steps = []
+        for u, v in zip(node_ids[:-1], node_ids[1:]):
+            position = self.indptr[u] + np.nonzero(self.indices[self.indptr[u]:self.indptr[u + 1]] == v)[0][0]
+            steps.append((u, self.edge_segment[position]))
+
+        return self._join_segments(node_ids[0], steps)
+
+    def _join_segments(self, start_id: int, steps: list) -> sg.LineString:
+        """Joins the geometries of the rail segments of a path to one LineString
+
+        Args:
+            start_id (int): The node id where the path starts
+            steps (list): [(node id, segment)] the rail segments of the path and the node where each one is entered
+
+        Returns:
+            shapely.LineString: The path following the rail segments
+        """
+        coords = [tuple(self.node_coords[start_id])]
+        for u, segment_index in steps:
+            segment = list(self.geometries[segment_index].coords)
+            # turn the segment if it is digitized in the other direction
+            if segment[0][:2] != tuple(self.node_coords[u]):
+                segment.reverse()
+            coords.extend(segment[1:])
+
+        return sg.LineString(coords)
+
+    def shortest_path(self, start_node, end_node) -> sg.LineString:
+        """Calculates the shortest path between two nodes with Dijkstra Algorithm
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_node (tuple): The node of the end station
+
+        Returns:
+            shapely.LineString: Shortest path in LineString geometry
+        """
+        start_id = self._node_id(start_node)
+        end_id = self._node_id(end_node)
+        if start_id < 0 or end_id < 0:
+            raise nx.NodeNotFound(f"Station {start_node} or {end_node} is not in the rail network")
+
+        predecessors = self._search(start_id)
+        if start_id == end_id or predecessors[end_id] < 0:
+            raise nx.NetworkXNoPath(f"No path between {start_node} and {end_node}")
+
+        return self._path_geometry(predecessors, end_id)
+
+    def shortest_paths(self, start_node, end_nodes: list) -> dict:
+        """Calculates the shortest paths from one start node to many end nodes with a single Dijkstra search
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_nodes (list): The nodes of the end stations
+
+        Returns:
+            dict: {end_node: shapely.LineString} for every end node which can be reached from the start node
+        """
+        start_id = self._node_id(start_node)
+        if start_id < 0:
+            return {}
+        predecessors = self._search(start_id)
+
+        paths = {}
+        for end_node in end_nodes:
+            end_id = self._node_id(end_node)
+            if end_id >= 0 and end_id != start_id and predecessors[end_id] >= 0:
+                paths[end_node] = self._path_geometry(predecessors, end_id)
+
+        return paths
+
+
+class ChEngine(CsrEngine):
+    """Routing engine which answers the shortest path queries with a bidirectional upward search in a contraction
+    hierarchy (see routing/contraction.py). The hierarchy is loaded from fname_ch or built and saved there if it does
+    not exist or does not fit to the rail network
+
+    Args:
+        rail_segments_gdf (gpd.GeoDataFrame): The preprocessed GeoDataFrame containing the rail network
+        fname_ch (str): Filename of the contraction hierarchy without file extension
+        fingerprint (str): Fingerprint of the rail network file (def network_fingerprint), a saved hierarchy is only
+            used if it was built for the same fingerprint
+    """
+
+    def __init__(self, rail_segments_gdf: gpd.GeoDataFrame, fname_ch: str, fingerprint: str = None):
+        super().__init__(rail_segments_gdf)
+        hierarchy = None
+        if os.path.exists(f"{fname_ch}.npz"):
+            hierarchy = load_contraction_hierarchy(fname_ch)
+            if fingerprint is not None:
+                fits = "fingerprint" in hierarchy and str(hierarchy["fingerprint"]) == fingerprint
+            else:
+                fits = hierarchy["n_nodes"] == len(self.node_coords) and hierarchy["n_segments"] == len(self.geometries)
+            if fits == False:
+                e.info("ROUTING: CONTRACTION HIERARCHY DOES NOT FIT TO THE RAIL NETWORK")
+                hierarchy = None
+        if hierarchy is None:
+            e.info("ROUTING: BUILDING CONTRACTION HIERARCHY")
+            hierarchy = build_contraction_hierarchy(self)
+            save_contraction_hierarchy(hierarchy, fname_ch, fingerprint)
+
+        self.up_indptr = hierarchy["up_indptr"]
+        self.up_indices = hierarchy["up_indices"]
+        self.up_weights = hierarchy["up_weights"]
+        self.up_middle = hierarchy["up_middle"]
+        self.up_segment = hierarchy["up_segment"]
+
+    def _up_position(self, node_id: int, neighbour_id: int) -> int:
+        """Returns the position of the upward edge from node_id to neighbour_id in the hierarchy arrays"""
+        start, end = self.up_indptr[node_id], self.up_indptr[node_id + 1]
+        return int(start + np.nonzero(self.up_indices[start:end] == neighbour_id)[0][0])
+
+    def _query(self, start_id: int, end_id: int):
+        """Bidirectional upward search from the start and the end node. The shortest path goes up from both sides to
+        the highest ranked node on it, where both searches meet
+
+        Returns:
+            tuple: (meeting node, predecessors of the forward and backward search {node: (previous node, position)}),
+                   meeting node is -1 if there is no path
+        """
+        distances = ({start_id: 0.0}, {end_id: 0.0})
+        predecessors = ({start_id: None}, {end_id: None})
+        heaps = ([(0.0, start_id)], [(0.0, end_id)])
+        best, meeting = np.inf, -1
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                if not heaps[side]:
+                    continue
+                cost, node = heapq.heappop(heaps[side])
+                if cost > distances[side][node]:
+                    continue
+                # this direction cannot improve the best path any more
+                if cost >= best:
+                    heaps[side].clear()
+                    continue
+                if node in distances[1 - side] and cost + distances[1 - side][node] < best:
+                    best, meeting = cost + distances[1 - side][node], node
+                start, end = self.up_indptr[node], self.up_indptr[node + 1]
+                for position, neighbour, weight in zip(range(start, end), self.up_indices[start:end].tolist(), self.up_weights[start:end].tolist()):
+                    new_cost = cost + weight
+                    if neighbour not in distances[side] or new_cost < distances[side][neighbour]:
+                        distances[side][neighbour] = new_cost
+                        predecessors[side][neighbour] = (node, position)
+                        heapq.heappush(heaps[side], (new_cost, neighbour))
+
+        return meeting, predecessors
+
+    def _unpack(self, from_id: int, to_id: int, position: int) -> list:
+        """Replaces an edge of the hierarchy recursively by the rail segments it stands for
+
+        Returns:
+            list: [(node id, segment)] the rail segments in the direction from from_id to to_id
+        """
+        steps = []
+        stack = [(from_id, to_id, position)]
+        while stack:
+            u, v, position = stack.pop()
+            middle = int(self.up_middle[position])
+            if middle < 0:
+                steps.append((u, int(self.up_segment[position])))
+            else:
+                # both halves of a shortcut are stored at the contracted middle node
+                stack.append((middle, v, self._up_position(middle, v)))
+                stack.append((u, middle, self._up_position(middle, u)))
+
+        return steps
+
+    def _ch_path(self, start_id: int, end_id: int) -> sg.LineString:
+        """Calculates the geometry of the shortest path between two node ids or None if there is no path"""
+        meeting, predecessors = self._query(start_id, end_id)
+        if meeting < 0:
+            return None
+
+        steps = []
+        # forward search: edges lead upwards from the start node to the meeting node
+        edges = []
+        node = meeting
+        while predecessors[0][node] is not None:
+            previous, position = predecessors[0][node]
+            edges.append((previous, node, position))
+            node = previous
+        for previous, node, position in reversed(edges):
+            steps.extend(self._unpack(previous, node, position))
+        # backward search: edges lead upwards from the end node, so they are followed downwards
+        node = meeting
+        while predecessors[1][node] is not None:
+            previous, position = predecessors[1][node]
+            steps.extend(self._unpack(node, previous, position))
+            node = previous
+
+        return self._join_segments(start_id, steps)
+
+    def shortest_path(self, start_node, end_node) -> sg.LineString:
+        """Calculates the shortest path between two nodes with the contraction hierarchy
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_node (tuple): The node of the end station
+
+        Returns:
+            shapely.LineString: Shortest path in LineString geometry
+        """
+        start_id = self._node_id(start_node)
+        end_id = self._node_id(end_node)
+        if start_id < 0 or end_id < 0:
+            raise nx.NodeNotFound(f"Station {start_node} or {end_node} is not in the rail network")
+
+        path = self._ch_path(start_id, end_id) if start_id != end_id else None
+        if path is None:
+            raise nx.NetworkXNoPath(f"No path between {start_node} and {end_node}")
+
+        return path
+
+    def shortest_paths(self, start_node, end_nodes: list) -> dict:
+        """Calculates the shortest paths from one start node to many end nodes with one query in the contraction
+        hierarchy for each pair
+
+        Args:
+            start_node (tuple): The node of the start station
+            end_nodes (list): The nodes of the end stations
+
+        Returns:
+            dict: {end_node: shapely.LineString} for every end node which can be reached from the start node
+        """
+        start_id = self._node_id(start_node)
+        if start_id < 0:
+            return {}
+
+        paths = {}
+        for end_node in end_nodes:
+            end_id = self._node_id(end_node)
+            if end_id >= 0 and end_id != start_id:
+                path = self._ch_path(start_id, end_id)
+                if path is not None:
+                    paths[end_node] = path
+
+        return paths
+
+
+# Available routing engines, selected by their name
+ENGINES = {"networkx": NetworkxEngine, "csr": CsrEngine}
+
+
+# Keeps the routing engine of the last loaded rail network in memory {(filename, engine): (modification time, engine)}
+_loaded_networks = {}
+
+
+def load_network(fname_rail: str, engine: str = "networkx", fname_ch: str = None, cache_dir: str = None):
+    """Returns the routing engine for the rail network stored in fname_rail. The graph is only built again if the
+    file has changed since the last call (e.g. a new combination of countries has been preprocessed)
+
+    Args:
+        fname_rail (str): Filename of the preprocessed rail network
+        engine (str): Name of the routing engine ("networkx", "csr" or "ch")
+        fname_ch (str): Filename of the contraction hierarchy (only for the engine "ch")
+        cache_dir (str): If given, the paths are cached in this directory (see routing/cache.py)
+
+    Returns:
+        NetworkxEngine, CsrEngine, ChEngine or CachedEngine: The routing engine of the rail network
+    """
+    fname_stored = e.gdf_path(fname_rail)
+    modified = os.path.getmtime(fname_stored)
+    key = (fname_rail, engine)
+    if key in _loaded_networks and _loaded_networks[key][0] == modified:
+        e.info("ROUTING: USING RAIL GRAPH FROM MEMORY")
+        return _loaded_networks[key][1]
+
+    e.info("ROUTING: CREATING RAIL GRAPH")
+    rail_gdf = e.read_gdf(fname_rail)
+    fingerprint = network_fingerprint(fname_stored) if engine == "ch" or cache_dir is not None else None
+    if engine == "ch":
+        network = ChEngine(rail_gdf, fname_ch, fingerprint)
+    else:
+        network = ENGINES[engine](rail_gdf)
+    if cache_dir is not None:
+        network = CachedEngine(network, PathCache(cache_dir, fingerprint))
+    _loaded_networks.clear()
+    _loaded_networks[key] = (modified, network)
+
+    return network
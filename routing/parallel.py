@@ -0,0 +1,94 @@
+import multiprocessing
+import etl as e
+from .cache import CachedEngine
+
+# Routing engine of the worker processes. Where fork is available (Linux, macOS) it is set before the pool is forked, so
+# the workers share the graph of the parent process (copy-on-write) and it is never pickled. Spawned workers (Windows)
+# get the engine once at their start by def _init_worker
+_worker_network = None
+
+
+def _init_worker(network) -> None:
+    """Sets the routing engine of a spawned worker process
+
+    Args:
+        network: The routing engine (NetworkxEngine, CsrEngine or ChEngine)
+    """
+    global _worker_network
+    _worker_network = network
+
+
+def _search_row(query: tuple) -> dict:
+    """Runs the search for one origin station in a worker process
+
+    Args:
+        query (tuple): (start_node, [end_nodes])
+
+    Returns:
+        dict: {end_node: shapely.LineString} for every end node which can be reached from the start node
+    """
+    start_node, end_nodes = query
+    return _worker_network.shortest_paths(start_node, end_nodes)
+
+
+def parallel_shortest_paths(network, queries: list, workers: int) -> list:
+    """This function runs the one-to-many searches of several origin stations in a pool of worker processes.
+    Paths which are in the cache of a CachedEngine are taken from there and the new paths are cached afterwards
+
+    Args:
+        network: The routing engine (NetworkxEngine, CsrEngine, ChEngine or CachedEngine)
+        queries (list): [(start_node, [end_nodes])] one search for each origin station
+        workers (int): Number of worker processes
+
+    Returns:
+        list: [{end_node: shapely.LineString}] the paths for each query in the same order
+    """
+    global _worker_network
+
+    # the cache is only used in the parent process (its sqlite connection cannot be shared with the worker processes)
+    cache = None
+    if isinstance(network, CachedEngine):
+        cache, network = network.cache, network.network
+
+    results = []
+    pending = []
+    for start_node, end_nodes in queries:
+        paths = {}
+        missing = []
+        for end_node in end_nodes:
+            path = cache.get(start_node, end_node) if cache is not None and end_node != start_node else None
+            if path is None:
+                missing.append(end_node)
+            else:
+                paths[end_node] = path
+        results.append(paths)
+        pending.append((start_node, missing))
+
+    # only origins with missing paths are sent to the workers
+    pending_index = [i for i, (_, missing) in enumerate(pending) if missing != []]
+    if pending_index == []:
+        return results
+
+    processes = min(workers, len(pending_index))
+    if "fork" in multiprocessing.get_all_start_methods():
+        e.info(f"ROUTING: SEARCHING {len(pending_index)} ORIGINS IN {processes} FORKED WORKER PROCESSES")
+        _worker_network = network
+        context, initializer, initargs = multiprocessing.get_context("fork"), None, ()
+    else:
+        # the engine is pickled once for each spawned worker
+        e.info(f"ROUTING: SEARCHING {len(pending_index)} ORIGINS IN {processes} SPAWNED WORKER PROCESSES")
+        context, initializer, initargs = multiprocessing.get_context("spawn"), _init_worker, (network,)
+    try:
+        with context.Pool(processes, initializer, initargs) as pool:
+            found = pool.map(_search_row, [pending[i] for i in pending_index], chunksize=1)
+    finally:
+        _worker_network = None
+
+    for i, paths in zip(pending_index, found):
+        start_node = pending[i][0]
+        for end_node, path in paths.items():
+            if cache is not None:
+                cache.put(start_node, end_node, path)
+        results[i].update(paths)
+
+    return results
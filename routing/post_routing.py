@@ -1,38 +1,32 @@
 import geopandas as gpd
 import pandas as pd
 import numpy as np
+from .tsp_solvers import TspResult
 
 
-def merge_tsp_solution(dict_distance_matrix: dict, plan_output:str, crs: str) -> gpd.GeoDataFrame:
+def merge_tsp_solution(dict_distance_matrix: dict, tsp_result: TspResult, crs: str) -> gpd.GeoDataFrame:
     """This function creates a GeoDataFrame containing the optimized route.
 
     Args:
         dict_distance_matrix (dict): The in tsp.py created dictionary for the matrices and properties of TSP
-        plan_output (str): The in tsp.py created output plan containing the order of cities
+        tsp_result (TspResult): The in tsp.py created result containing the order of cities and the leg distances
         crs (str): The desired coordinate reference system of the output route GeoDataFrame
 
     Returns:
         gpd.GeoDataFrame:  Each row is one part of the route and a pair of cites (start and end)
     """
-    plan_list = plan_output.split(' ')
-    plan_list.remove('')
-
-    # Create empty Dictionary for GeoDataFrame
-    route_dict = {'start_city': [], 'end_city': [], 'geometry': [], 'distance': [], 'order': []}
-
-    for i in range(len(plan_list)-1):
-        start_city_index = int(plan_list[i])
-        end_city_index = int(plan_list[i+1])
-        route = dict_distance_matrix['path_matrix'][start_city_index][end_city_index]
-        distance = dict_distance_matrix['distance_matrix'][start_city_index][end_city_index]
-        route_dict['start_city'].append(dict_distance_matrix['stop'][start_city_index]) 
-        route_dict['end_city'].append(dict_distance_matrix['stop'][end_city_index]) 
-        route_dict['geometry'].append(route) 
-        route_dict['distance'].append(distance) 
-        route_dict['order'].append(i+1)
-
-    route_df = pd.DataFrame (route_dict, columns = ['start_city','end_city', 'geometry', 'distance', 'order'])
-    route_gdf = gpd.GeoDataFrame(route_df, crs=crs)
+    start_index = tsp_result.order[:-1]
+    end_index = tsp_result.order[1:]
+    stop = np.array(dict_distance_matrix['stop'], dtype=object)
+    path_matrix = dict_distance_matrix['path_matrix']
+
+    route_gdf = gpd.GeoDataFrame({
+        'start_city': stop[start_index],
+        'end_city': stop[end_index],
+        'geometry': [path_matrix[i][j] for i, j in zip(start_index, end_index)],
+        'distance': tsp_result.leg_distances,
+        'order': np.arange(1, len(start_index) + 1)
+        }, geometry='geometry', crs=crs)
 
     return(route_gdf)
 
@@ -49,6 +43,10 @@ def features_on_way(feature_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame, l
     Returns:
         gpd.GeoDataFrame: Point GeoDataFrame with selection 
     """
+    # Nothing to select in an empty layer (e.g. no heritage sites in the countries)
+    if feature_gdf.empty:
+        return gpd.GeoDataFrame(feature_gdf, geometry="geometry", crs=crs)
+
     # Create bounding box for the points in offset distance in meters (that's the reason for the reprojection)
     feature_bbox = feature_gdf.bounds + [-offset, -offset, offset, offset]
 
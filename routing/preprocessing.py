@@ -1,9 +1,27 @@
 import shapely.geometry as sg
-from shapely.ops import split
+from shapely.ops import substring
 from shapely.geometry import Point, MultiPoint, LineString, MultiLineString
 import geopandas as gpd
 import pandas as pd
 import numpy as np
+import etl as e
+from scipy.spatial import cKDTree
+from scipy.sparse.csgraph import connected_components
+from .engine import CsrEngine
+from .tsp import nearest_stations
+
+
+def _query_bulk(line_gdf: gpd.GeoDataFrame, geometries: gpd.GeoSeries) -> tuple:
+    """Queries the spatial index of line_gdf once for all geometries. sindex.query takes arrays of geometries since
+    geopandas 0.12 (sindex.query_bulk was removed in geopandas 1.0), older versions only have sindex.query_bulk
+
+    Returns:
+        tuple: (positions of the geometries, positions of the lines) of the bounding box hits
+    """
+    version = tuple(int(part) for part in gpd.__version__.split(".")[:2])
+    if version >= (0, 12):
+        return line_gdf.sindex.query(geometries.values)
+    return line_gdf.sindex.query_bulk(geometries)
 
 
 def snap_spatial_index(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame, offset: int) -> gpd.GeoDataFrame:
@@ -17,41 +35,31 @@ def snap_spatial_index(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame,
     Returns:
         gpd.GeoDataFrame: Point GeoDataFrame with updated locations snapped to lines, point outside the tolerance are deleted 
     """
-    # Create bounding box for the points in offset distance in meters (that's the reason for the reprojection)
-    station_bbox = point_gdf.bounds + [-offset, -offset, offset, offset]
+    # Query the spatial index once for all points: candidate lines within the offset square around each point
+    boxes = point_gdf.geometry.buffer(offset, cap_style=3)
+    pt_i, line_i = _query_bulk(line_gdf, boxes)
 
-    # Apply an operation to this station_bbox to get a list of the lines (sptially indexed) that overlap
-    hits = station_bbox.apply(lambda row: list(line_gdf.sindex.intersection(row)), axis=1)
-    tmp = pd.DataFrame({
-        "pt_idx": np.repeat(hits.index, hits.apply(len)), 
-        "line_i": np.concatenate(hits.values)
-    })
+    # Calculate the distance between each candidate line and its point on the geometry arrays
+    points = gpd.GeoSeries(point_gdf.geometry.values[pt_i], crs=point_gdf.crs)
+    lines = gpd.GeoSeries(line_gdf.geometry.values[line_i], crs=point_gdf.crs)
+    snap_dist = lines.distance(points).values
 
-    # Join back to the lines on line_i 
-    tmp = tmp.join(line_gdf.reset_index(drop=True), on="line_i") 
-    tmp = tmp.join(point_gdf.geometry.rename("point"), on="pt_idx") 
-    tmp = gpd.GeoDataFrame(tmp, geometry="geometry", crs=point_gdf.crs) 
-
-    # Calculate the distance between each line and its associated point feature
-    tmp["snap_dist"] = tmp.geometry.distance(gpd.GeoSeries(tmp.point))
-
-    # Discard and sort lines by distance to each point
-    tmp = tmp.loc[tmp.snap_dist <= offset] 
-    tmp = tmp.sort_values(by=["snap_dist"]) 
-
-    # Find closest line to a point
-    closest = tmp.groupby("pt_idx").first() 
-    closest = gpd.GeoDataFrame(closest, geometry="geometry") 
+    # Discard lines outside the offset and keep the closest line to each point
+    within = snap_dist <= offset
+    pt_i, line_i, snap_dist = pt_i[within], line_i[within], snap_dist[within]
+    order = np.lexsort((line_i, snap_dist, pt_i))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pt_i[order][1:] != pt_i[order][:-1]
+    pt_i, line_i = pt_i[order][first], line_i[order][first]
 
     # Real Snapping
-    pos = closest.geometry.project(gpd.GeoSeries(closest.point)) 
-    new_pts = closest.geometry.interpolate(pos) 
+    points = gpd.GeoSeries(point_gdf.geometry.values[pt_i], crs=point_gdf.crs)
+    lines = gpd.GeoSeries(line_gdf.geometry.values[line_i], crs=point_gdf.crs)
+    new_pts = lines.interpolate(lines.project(points))
 
-    # Join back the new geometry to our original station  
-    line_columns = []    
-    snapped = gpd.GeoDataFrame(closest[line_columns],geometry=new_pts) 
-    updated_points = point_gdf.drop(columns=["geometry"]).join(snapped) 
-    updated_points = updated_points.dropna(subset=["geometry"]) 
+    # Points outside the tolerance are deleted
+    updated_points = point_gdf.iloc[pt_i].copy()
+    updated_points["geometry"] = new_pts.values
 
     return updated_points 
     
@@ -69,41 +77,23 @@ def connect_points_spatial_index(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoD
         gpd.GeoDataFrame: Line GeoDataFrame with updated lines as connections between the points 
     """
     
-    # Create bounding box for the points in offset distance in meters
-    station_bbox = point_gdf.bounds + [-offset, -offset, offset, offset]
-
-    # Apply an operation to this station_bbox to get a list of the points (sptially indexed) that overlap
-    hits = station_bbox.apply(lambda row: list(point_gdf.sindex.intersection(row)), axis=1)
-    tmp = pd.DataFrame({
-        "pt_idx": np.repeat(hits.index, hits.apply(len)),
-        "pt_i": np.concatenate(hits.values)
-    })
-
-    # Drop self intersections
-    tmp = tmp[tmp["pt_idx"] != tmp["pt_i"]]
-
-    # Join bakc to get the geometries
-    tmp = tmp.join(point_gdf.reset_index(drop=True), on="pt_i") 
-    tmp = tmp.join(point_gdf.geometry.rename("point"), on="pt_idx")
-    
-    # Create Linestrings connecting the stations
-    tmp["line"] = tmp.apply(lambda row: LineString([row["geometry"], row["point"]]), axis=1)
-    
-    # Manage columns to be appended to the rails.gdf
-    tmp = tmp.set_geometry('line')
-    tmp = tmp.reset_index()
-    tmp = tmp.drop(['index', 'pt_idx', 'pt_i', 'network', 'geometry', 'point'], axis=1)
-    tmp = tmp.rename_geometry('geometry')
-    tmp["name"] = ['change'] * tmp.shape[0]
-
-    line_gdf = line_gdf.append(tmp, ignore_index=True)
+    # Find all pairs of points within the offset distance with one query of a KD-tree (each pair only once)
+    coords = np.column_stack([point_gdf.geometry.x.values, point_gdf.geometry.y.values])
+    pairs = cKDTree(coords).query_pairs(offset, output_type="ndarray")
+
+    # Create Linestrings connecting the stations from the coordinate arrays
+    changes = [LineString([start, end]) for start, end in zip(coords[pairs[:, 0]].tolist(), coords[pairs[:, 1]].tolist())]
+    tmp = gpd.GeoDataFrame({"name": ["change"] * len(changes)}, geometry=changes, crs=line_gdf.crs)
+
+    line_gdf = gpd.GeoDataFrame(pd.concat([line_gdf, tmp], ignore_index=True), crs=line_gdf.crs)
     
     return line_gdf 
 
 
 def split_line_spatial_index(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame, offset: int) -> gpd.GeoDataFrame:
     """
-    This function splits line features from line_gdf when they contain intermediate points from points_gdf within the offset distance
+    This function splits line features from line_gdf at all intermediate points from points_gdf within the offset
+    distance in one pass. The split lines are replaced by their segments, so the segments do not overlap
     
     Args:
         point_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with point geometry
@@ -111,41 +101,293 @@ def split_line_spatial_index(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataF
         offset (int): Tolerance for points to work as split points for a line in crs metrics
     
     Returns:
-        gpd.GeoDataFrame: Line GeoDataFrame with updated lines split by the points 
+        gpd.GeoDataFrame: Line GeoDataFrame with the segments of the lines split by the points and a stable "seg_id"
     """
+    # Query the spatial index once for all points: candidate lines within the offset square around each point
+    boxes = point_gdf.geometry.buffer(offset, cap_style=3)
+    pt_i, line_i = _query_bulk(line_gdf, boxes)
 
-    # Create bounding box for the points in offset distance in meters
-    station_bbox = point_gdf.bounds + [-offset, -offset, offset, offset]
+    # Keep the lines within the offset and find the positions of the points on them (linear referencing)
+    points = gpd.GeoSeries(point_gdf.geometry.values[pt_i], crs=point_gdf.crs)
+    lines = gpd.GeoSeries(line_gdf.geometry.values[line_i], crs=point_gdf.crs)
+    within = (lines.distance(points).values <= offset) & (lines.geom_type.values == "LineString")
+    positions = lines.project(points).values[within]
+    lengths = lines.length.values[within]
+    pt_i, line_i = pt_i[within], line_i[within]
 
-    # Apply an operation to this station_bbox to get a list of the lines (sptially indexed) that overlap
-    hits = station_bbox.apply(lambda row: list(line_gdf.sindex.intersection(row)), axis=1)
+    # Only the points between the ends of a line split it
+    inner = (positions > 1e-6) & (positions < lengths - 1e-6)
+    pt_i, line_i, positions = pt_i[inner], line_i[inner], positions[inner]
 
-    # Create a better datastructure to relate the points to their lines in tolerance distance
-    tmp = pd.DataFrame({
-        "pt_idx": np.repeat(hits.index, hits.apply(len)),   
-        "line_i": np.concatenate(hits.values)
-    })
+    # Sort the split points by line and by their position on the line
+    order = np.lexsort((positions, line_i))
+    pt_i, line_i, positions = pt_i[order], line_i[order], positions[order]
+    first = np.flatnonzero(np.r_[True, line_i[1:] != line_i[:-1]]) if len(line_i) > 0 else np.array([], dtype=np.int64)
+
+    # Cut each line at all of its split points: the segments end exactly at the points, so they become nodes
+    point_coords = np.column_stack([point_gdf.geometry.x.values, point_gdf.geometry.y.values])
+    segments = [[geometry] for geometry in line_gdf.geometry.values]
+    for line, line_positions, line_points in zip(line_i[first], np.split(positions, first[1:]), np.split(pt_i, first[1:])):
+        geometry = segments[line][0]
+        keep = np.r_[True, np.diff(line_positions) > 1e-6]
+        cuts = [0.0] + line_positions[keep].tolist() + [geometry.length]
+        cut_coords = [None] + point_coords[line_points[keep]].tolist() + [None]
+        line_segments = []
+        for k in range(len(cuts) - 1):
+            coords = list(substring(geometry, cuts[k], cuts[k + 1]).coords)
+            if cut_coords[k] is not None:
+                coords[0] = tuple(cut_coords[k])
+            if cut_coords[k + 1] is not None:
+                coords[-1] = tuple(cut_coords[k + 1])
+            line_segments.append(LineString(coords))
+        segments[line] = line_segments
+
+    # Replace the split lines by their segments
+    n_segments = [len(line_segments) for line_segments in segments]
+    line_gdf = gpd.GeoDataFrame(line_gdf.drop(columns=["geometry"]).iloc[np.repeat(np.arange(len(line_gdf)), n_segments)],
+                                geometry=[segment for line_segments in segments for segment in line_segments],
+                                crs=line_gdf.crs)
+    line_gdf = line_gdf.reset_index(drop=True)
+    line_gdf["seg_id"] = np.arange(len(line_gdf), dtype=np.int64)
+
+    return line_gdf
+
+
+def label_components(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    This function labels the connected components of the rail network and writes the component of each station in
+    the column "component". Stations in different components cannot be connected by any path. The components are
+    numbered by their size (0 is the biggest network), stations which are not on the network get -1
+
+    Args:
+        point_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the snapped stations
+        line_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the split rail segments
+
+    Returns:
+        gpd.GeoDataFrame: Point GeoDataFrame with the column "component"
+    """
+    network = CsrEngine(line_gdf)
+    n_components, labels = connected_components(network.csgraph, directed=False)
+
+    # renumber the components by their number of nodes
+    sizes = np.bincount(labels, minlength=n_components)
+    new_labels = np.empty(n_components, dtype=np.int64)
+    new_labels[np.argsort(-sizes, kind="stable")] = np.arange(n_components)
+    labels = new_labels[labels]
+
+    components = []
+    for station_point in point_gdf.geometry:
+        node_id = network._node_id(network.station_node(station_point))
+        components.append(int(labels[node_id]) if node_id >= 0 else -1)
+
+    point_gdf = point_gdf.copy()
+    point_gdf["component"] = components
+
+    return point_gdf
+
+
+def link_city_station(city_gdf: gpd.GeoDataFrame, station_gdf: gpd.GeoDataFrame, k: int) -> gpd.GeoDataFrame:
+    """
+    This function creates the link table between cities and stations: for each city the k nearest stations (positional
+    index in station_gdf), their distances and their connected components (column "component" by def label_components)
+
+    Args:
+        city_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the cities
+        station_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the snapped and labelled stations
+        k (int): Number of nearest stations for each city
+
+    Returns:
+        gpd.GeoDataFrame: City GeoDataFrame (name and geometry) with the columns station_1, dist_1, comp_1, ... station_k
+    """
+    k = min(k, len(station_gdf))
+    distances, station_index = nearest_stations(city_gdf, station_gdf, k=k)
+    components = np.asarray(station_gdf["component"])[station_index]
+
+    link_gdf = gpd.GeoDataFrame({"name": list(city_gdf["name"])}, geometry=list(city_gdf.geometry), crs=city_gdf.crs)
+    for i in range(k):
+        link_gdf[f"station_{i+1}"] = station_index[:, i]
+        link_gdf[f"dist_{i+1}"] = distances[:, i]
+        link_gdf[f"comp_{i+1}"] = components[:, i]
+
+    return link_gdf
+
+
+def node_network(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame, grid: float) -> tuple:
+    """
+    This function quantises the coordinates of the stations and rail segments to a grid, so that segment ends which
+    differ only by floating point noise become the same node of the graph. Repeated vertices, segments which collapse
+    to a point and identical segments (also in opposite direction) are removed
+
+    Args:
+        point_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the snapped stations
+        line_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the split rail segments
+        grid (float): Size of the grid in crs metrics (e.g. 0.1 m)
+
+    Returns:
+        tuple: (point GeoDataFrame, line GeoDataFrame) with the quantised geometries
+    """
+    def quantise(coords):
+        return np.round(np.asarray(coords, dtype=np.float64)[:, :2] / grid) * grid
+
+    n_nodes = len({coords for geometry in line_gdf.geometry for coords in (geometry.coords[0][:2], geometry.coords[-1][:2])})
+    n_lines = len(line_gdf)
+
+    # quantise the segments and remove the repeated vertices
+    geometries = []
+    keys = []
+    for geometry in line_gdf.geometry:
+        coords = quantise(geometry.coords)
+        coords = coords[np.r_[True, np.any(coords[1:] != coords[:-1], axis=1)]]
+        if len(coords) < 2:
+            geometries.append(None)
+            keys.append(None)
+            continue
+        geometries.append(LineString(coords.tolist()))
+        # the same key for both directions of a segment
+        if tuple(coords[0]) > tuple(coords[-1]) or (tuple(coords[0]) == tuple(coords[-1]) and tuple(coords[1]) > tuple(coords[-2])):
+            coords = coords[::-1]
+        keys.append(coords.tobytes())
+
+    # remove the collapsed and duplicated segments
+    keys = pd.Series(keys, index=line_gdf.index)
+    valid = (keys.notna() & ~keys.duplicated()).to_numpy()
+    line_gdf = gpd.GeoDataFrame(line_gdf.drop(columns=["geometry"])[valid],
+                                geometry=[geometry for geometry, is_valid in zip(geometries, valid) if is_valid],
+                                crs=line_gdf.crs)
+    line_gdf = line_gdf.reset_index(drop=True)
+
+    # quantise the stations in the same way, so they stay nodes of the network
+    point_coords = quantise([point.coords[0] for point in point_gdf.geometry]) if len(point_gdf) > 0 else np.empty((0, 2))
+    point_gdf = point_gdf.copy()
+    point_gdf["geometry"] = gpd.points_from_xy(point_coords[:, 0], point_coords[:, 1], crs=point_gdf.crs)
+
+    new_nodes = len({coords for geometry in line_gdf.geometry for coords in (geometry.coords[0], geometry.coords[-1])})
+    e.info(f"PREPROCESSING: NODING REDUCED THE NETWORK FROM {n_nodes} NODES AND {n_lines} SEGMENTS TO "
+           f"{new_nodes} NODES AND {len(line_gdf)} SEGMENTS")
+
+    return point_gdf, line_gdf
+
+
+def stitch_networks(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame, grid: float, connect_offset: int = 500,
+                    split_offset: int = 2) -> tuple:
+    """
+    This function stitches the merged networks of several countries at the borders. A rail way across a border is in
+    the data of both countries, but each copy is only split at the stations of its own country. So the rails are split
+    again at the stations of all countries, then both copies have the same segments and the noding keeps one of them
+
+    Args:
+        point_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the snapped stations of all countries
+        line_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the noded rail segments of all countries
+        grid (float): Size of the grid in crs metrics for def node_network
+        connect_offset (int): Distance for connecting stations for changing across the borders in crs metrics
+        split_offset (int): Tolerance for stations to work as split points in crs metrics
+
+    Returns:
+        tuple: (point GeoDataFrame, line GeoDataFrame) of the stitched network
+    """
+    # connect stations for changing across the borders
+    line_gdf = connect_points_spatial_index(point_gdf=point_gdf, line_gdf=line_gdf, offset=connect_offset)
+    # split the rails of each country at the stations of the other countries
+    line_gdf = split_line_spatial_index(point_gdf=point_gdf, line_gdf=line_gdf, offset=split_offset)
+    # connect the rails at the borders and remove the segments which are in more than one country
+    return node_network(point_gdf=point_gdf, line_gdf=line_gdf, grid=grid)
+
+
+def simplify_network(point_gdf: gpd.GeoDataFrame, line_gdf: gpd.GeoDataFrame) -> tuple:
+    """
+    This function merges chains of rail segments through pass-through nodes (nodes with exactly two segments) into
+    single edges. Stations, junctions, dead ends and border points (segments of different countries in column
+    "country") stay nodes. The merged geometries are the exact concatenation of the segments, so the paths do not change
+
+    Args:
+        point_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the snapped stations
+        line_gdf (gpd.GeoDataFrame): geopandas GeoDataFrame with the split rail segments
+
+    Returns:
+        tuple: (simplified line GeoDataFrame with the column "edge_id", the segments of line_gdf with the columns
+                "edge_id" and "edge_pos" which refer to their merged edge and their position in it)
+    """
+    line_gdf = line_gdf.reset_index(drop=True)
+    geometries = list(line_gdf.geometry.values)
+    n_lines = len(geometries)
+
+    # node ids of the end points of the segments
+    end_coords = np.array([[geometry.coords[0][:2], geometry.coords[-1][:2]] for geometry in geometries], dtype=np.float64).reshape(-1, 2)
+    node_coords, node_ids = np.unique(end_coords, axis=0, return_inverse=True)
+    node_ids = node_ids.reshape(-1)
+    starts, ends = node_ids[0::2], node_ids[1::2]
+    n_nodes = len(node_coords)
+
+    # nodes which are kept: junctions and dead ends, stations and border points
+    degree = np.bincount(starts, minlength=n_nodes) + np.bincount(ends, minlength=n_nodes)
+    keep = degree != 2
+    station_nodes = {point.coords[0][:2] for point in point_gdf.geometry}
+    keep |= np.array([node in station_nodes for node in map(tuple, node_coords.tolist())], dtype=bool)
+    if "country" in line_gdf.columns:
+        country = line_gdf["country"].astype(str).to_numpy()
+        known = line_gdf["country"].notna().to_numpy()
+        node_country = pd.DataFrame({"node": np.r_[starts[known], ends[known]], "country": np.r_[country[known], country[known]]})
+        n_countries = node_country.drop_duplicates().groupby("node").size()
+        keep[n_countries.index[n_countries > 1].to_numpy()] = True
+
+    incident = [[] for _ in range(n_nodes)]
+    for segment, (u, v) in enumerate(zip(starts.tolist(), ends.tolist())):
+        incident[u].append(segment)
+        incident[v].append(segment)
+
+    # walk along the chains from the kept nodes
+    edge_of = np.full(n_lines, -1, dtype=np.int64)
+    edge_pos = np.zeros(n_lines, dtype=np.int64)
+    chains = []
+    for node in np.flatnonzero(keep).tolist():
+        for segment in incident[node]:
+            if edge_of[segment] >= 0:
+                continue
+            chain = []
+            current = node
+            while True:
+                edge_of[segment] = len(chains)
+                edge_pos[segment] = len(chain)
+                forward = starts[segment] == current
+                chain.append((segment, forward))
+                current = ends[segment] if forward else starts[segment]
+                if keep[current]:
+                    break
+                a, b = incident[current]
+                segment = b if a == segment else a
+                if edge_of[segment] >= 0:
+                    break
+            chains.append(chain)
+
+    # closed rings without any kept node stay single segments
+    for segment in np.flatnonzero(edge_of < 0).tolist():
+        edge_of[segment] = len(chains)
+        chains.append([(segment, True)])
+
+    # merge the geometries of the chains in the direction of the walk
+    merged = []
+    for chain in chains:
+        coords = []
+        for segment, forward in chain:
+            segment_coords = list(geometries[segment].coords)
+            if not forward:
+                segment_coords.reverse()
+            coords.extend(segment_coords if coords == [] else segment_coords[1:])
+        merged.append(LineString(coords))
+
+    # the attributes of an edge are the ones of its first segment
+    first_segments = [chain[0][0] for chain in chains]
+    simple_gdf = gpd.GeoDataFrame(line_gdf.drop(columns=["geometry", "seg_id"], errors="ignore").iloc[first_segments],
+                                  geometry=merged, crs=line_gdf.crs)
+    simple_gdf = simple_gdf.reset_index(drop=True)
+    simple_gdf["edge_id"] = np.arange(len(simple_gdf), dtype=np.int64)
+
+    segments_gdf = line_gdf.copy()
+    segments_gdf["edge_id"] = edge_of
+    segments_gdf["edge_pos"] = edge_pos
+
+    e.info(f"PREPROCESSING: SIMPLIFIED NETWORK FROM {n_nodes} NODES AND {n_lines} SEGMENTS TO "
+           f"{int(keep.sum())} NODES AND {len(simple_gdf)} EDGES")
+
+    return simple_gdf, segments_gdf
 
-    # Join bakc to get the geometries
-    tmp = tmp.join(line_gdf.reset_index(drop=True), on="line_i") 
-    tmp = tmp.join(point_gdf.geometry.rename("point"), on="pt_idx") 
-    
-    # Split the lines by the already snapped stations
-    tmp["split_lines"] = tmp.apply(lambda row: split(row["geometry"], row["point"]), axis=1)
-    tmp["num_features"] = tmp.apply(lambda row: len(row["split_lines"]), axis=1)
-    tmp = tmp[tmp["num_features"]>1]
-
-    # Create new GeoDataFrame for split lines
-    split_lines_dic = {"name": [], "geometry": []}
-    for i, row in tmp.iterrows():
-        split_lines_dic["name"].append("split1")
-        split_lines_dic["name"].append("split2")
-        split_lines_dic["geometry"].append(row["split_lines"][0])
-        split_lines_dic["geometry"].append(row["split_lines"][1])
-    split_lines_df = pd.DataFrame (split_lines_dic, columns = ["name", "geometry"])
-    split_lines_gdf = gpd.GeoDataFrame(split_lines_df, crs=line_gdf.crs)
-
-    # Merge new split lines with original lines
-    line_gdf = line_gdf.append(split_lines_gdf, ignore_index=True)
-
-    return line_gdf
\ No newline at end of file
@@ -1,23 +1,45 @@
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
 import shapely.geometry as sg
 from shapely.geometry import Point, MultiPoint, LineString, MultiLineString
-from shapely.ops import nearest_points
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-import networkx as nx
-import momepy
+from scipy.spatial import cKDTree
 import etl as e
+from .parallel import parallel_shortest_paths
+from .tsp_solvers import TspResult, solve_tsp
 
 
-def city_to_station(gdf_city, gdf_station, list_input_city):
-    """Relates the input city to the closest station and if no station name it replaces the empty string by the city name
+def nearest_stations(gdf_point: gpd.GeoDataFrame, gdf_station: gpd.GeoDataFrame, k: int = 1):
+    """Finds the nearest stations for all points with one bulk query in a KD-tree of the station coordinates
+
+    Args:
+        gdf_point (gpd.GeoDataFrame): Points (e.g. cities) for which the nearest stations are looked for
+        gdf_station (gpd.GeoDataFrame): The stations
+        k (int): Number of nearest stations for each point
+
+    Returns:
+        tuple: (distances, station_index) arrays of shape (number of points, k) with the distances and the positional
+               indices of the stations in gdf_station (sorted by distance)
+    """
+    tree = cKDTree(np.column_stack([gdf_station.geometry.x, gdf_station.geometry.y]))
+    distances, station_index = tree.query(np.column_stack([gdf_point.geometry.x, gdf_point.geometry.y]), k=k)
+
+    return distances.reshape(len(gdf_point), k), station_index.reshape(len(gdf_point), k)
+
+
+def city_to_station(gdf_city, gdf_station, list_input_city, gdf_link=None, max_distance=2000):
+    """Relates the input city to the closest station and if no station name it replaces the empty string by the city name.
+    With the link table of the preprocessing the stations are looked up instead of searched: if the closest station of
+    a city is not connected to the network of the other cities, the next close station in this network is taken if it
+    is one of the k stations of the link table and not farther than max_distance from the city. Otherwise the closest
+    station is kept (and the city is reported by def unreachable_city)
 
     Args:
         gdf_city (gpd.GeoDataFrame)
         gdf_station (gpd.GeoDataFrame)
         list_input_city (gpd.GeoDataFrame): The input list of cities in correct order (first city is start and end point)
+        gdf_link (gpd.GeoDataFrame): Optional link table between cities and stations by def link_city_station
+        max_distance (float): Maximum distance of a station in the network of the other cities in crs metrics
     
     Returns:
         gpd.GeoDataFrame: For the stations which are visited in correct order
@@ -28,25 +50,32 @@ def city_to_station(gdf_city, gdf_station, list_input_city):
         }
     city_df = pd.DataFrame (city_data, columns = ['index','city'])
 
-    # Filtering the city GeoDataFrame(gdf_city) to match only the cities of interest (list_input_city).
-    new = gdf_city['name'].isin(list_input_city) # -> create a boolean
-    gdf_city = gdf_city[new]
-    
-    # calculate nearest_points() between each city in gdf_city and gdf_stations
-    multi_station = MultiPoint(gdf_station['geometry'])
-    output_gdf = gpd.GeoDataFrame()
-    for i, row in gdf_city.iterrows():
-        city_point = row['geometry']
-        city_name = row['name']
-        # get the nearest station to the city center
-        near_point = nearest_points(city_point, multi_station) # output = [city point, station point]
-        # create a one line gdf to append to output_gdf
-        near_station = gdf_station[gdf_station['geometry'] == near_point[1]]
-        near_station = gpd.GeoDataFrame(near_station)
-        near_station['city'] = ''
-        near_station['city'] = city_name
-
-        output_gdf = output_gdf.append(near_station)
+    if gdf_link is not None:
+        # look up the stations of the cities of interest in the link table
+        gdf_link = gdf_link[gdf_link['name'].isin(list_input_city)]
+        k = len([column for column in gdf_link.columns if column.startswith('station_')])
+        stations = gdf_link[[f'station_{i+1}' for i in range(k)]].to_numpy(dtype=np.int64)
+        components = gdf_link[[f'comp_{i+1}' for i in range(k)]].to_numpy(dtype=np.int64)
+        distances = gdf_link[[f'dist_{i+1}' for i in range(k)]].to_numpy(dtype=np.float64)
+
+        # the network of most cities (by their closest stations)
+        main_component = pd.Series(components[:, 0]).mode().min() if len(components) > 0 else -1
+        # take the closest station in this network within max_distance (or the closest one if there is none)
+        in_main = (components == main_component) & (components >= 0) & (distances <= max_distance)
+        choice = np.where(in_main.any(axis=1), in_main.argmax(axis=1), 0)
+        station_index = stations[np.arange(len(stations)), choice]
+
+        output_gdf = gdf_station.iloc[station_index].copy()
+        output_gdf['city'] = list(gdf_link['name'])
+    else:
+        # Filtering the city GeoDataFrame(gdf_city) to match only the cities of interest (list_input_city).
+        new = gdf_city['name'].isin(list_input_city) # -> create a boolean
+        gdf_city = gdf_city[new]
+
+        # get the nearest station to each city center with one query
+        _, station_index = nearest_stations(gdf_city, gdf_station)
+        output_gdf = gdf_station.iloc[station_index[:, 0]].copy()
+        output_gdf['city'] = list(gdf_city['name'])
 
     # order the output dataframe to have the start city at the beginning
     output_gdf = pd.merge(output_gdf, city_df, on=['city', 'city'])
@@ -54,14 +83,12 @@ def city_to_station(gdf_city, gdf_station, list_input_city):
     output_gdf = output_gdf.sort_index()
 
     # write city name as station name when there is nan
-    for i, row in output_gdf.iterrows():
-        if row['name'] == 'nan':
-            output_gdf.loc[i, 'name'] = row['city']
+    output_gdf['name'] = output_gdf['name'].where(output_gdf['name'] != 'nan', output_gdf['city'])
 
     return output_gdf
 
 
-def shortest_path(station_gdf : gpd.GeoDataFrame, start_station_name: str, end_station_name: str, rail_segments_gdf: gpd.GeoDataFrame):
+def shortest_path(station_gdf : gpd.GeoDataFrame, start_station_name: str, end_station_name: str, network):
     """
     calculate shortest path between two stations by station name
 
@@ -69,44 +96,144 @@ def shortest_path(station_gdf : gpd.GeoDataFrame, start_station_name: str, end_s
         station_gdf (GeoDataFrame): stations points GeoDataFrame
         start_station_name (str): Then name of the start station
         end_station_name (str): The name of the end station
-        rail_segments_gdf (GeoDataFrame): rails segments GeoDataFrame
+        network (NetworkxEngine): routing engine containing the graph of the rail segments
 
     Returns:
         shapely.LineString: Shortest path in LineString geometry
     """
     # Select the stations from stations_gdf by name
-    start_station = station_gdf[["name","geometry"]][station_gdf['name'] == start_station_name].head(1)
-    end_station = station_gdf[["name","geometry"]][station_gdf['name'] == end_station_name].head(1)
-    
-    # Create geodataframe from the stations selected
-    start_end_dataframe = start_station.append(end_station)
-    
-    # Transfer it into a graph
-    stations_nodes = momepy.gdf_to_nx(start_end_dataframe, approach='primal')
-    
-    # Create network from the rails GeoDataFrame
-    rail_network = momepy.gdf_to_nx(rail_segments_gdf, approach='primal')
+    start_station = station_gdf["geometry"][station_gdf['name'] == start_station_name].iloc[0]
+    end_station = station_gdf["geometry"][station_gdf['name'] == end_station_name].iloc[0]
 
     # Select start and end stations nodes
-    start_node = list(stations_nodes.nodes)[0]
-    end_node = list(stations_nodes.nodes)[1]
+    start_node = network.station_node(start_station)
+    end_node = network.station_node(end_station)
 
-    # Perform shortest path calculation with Dijkstra Algorithm
-    shortest_path = nx.shortest_path(rail_network, start_node, end_node, weight=None, method='dijkstra')
-    shortest_path_line_string = sg.LineString(list(shortest_path))
+    # Perform shortest path calculation with A* Algorithm on the rail segment lengths
+    shortest_path_line_string = network.shortest_path(start_node, end_node)
     
     return shortest_path_line_string
 
-def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_gdf, mirror_matrix: bool) -> dict:
+def unreachable_city(gdf_input_stations: gpd.GeoDataFrame, stop: list) -> str:
+    """This function checks with the connected components of the rail network (column "component" by
+    def label_components) if all stations can reach each other, before any path is searched
+
+    Args:
+        gdf_input_stations (gpd.GeoDataFrame): The GeoDataFrame of the input stations with the column "component"
+        stop (list): The stop names of the stations
+
+    Returns:
+        str: The stop which cannot be reached (like "error_city" in create_distance_matrix) or None
+    """
+    components = [int(component) for component in gdf_input_stations["component"]]
+    if len(set(components)) == 1 and components[0] >= 0:
+        return None
+
+    if len(components) == 2:
+        return f"{stop[1]} or {stop[0]}"
+
+    # the stations in the component of most stations are fine (if equal, the component of the start station)
+    counts = {component: components.count(component) for component in components if component >= 0}
+    main_component = components[0]
+    if counts != {}:
+        main_component = max(counts, key=lambda component: (counts[component], component == components[0]))
+    for i, component in enumerate(components):
+        if component != main_component or component < 0:
+            e.info(f"{stop[i]} is not connected to the rail network of the other stations")
+            return stop[i]
+
+
+def one_to_many_matrices(gdf_input_stations: gpd.GeoDataFrame, stop: list, network, mirror_matrix: bool, workers: int = 1):
+    """This function fills the distance and path matrices row by row. For every origin station only one search is run
+    in the graph, which stops when all destination stations are reached
+
+    Args:
+        gdf_input_stations (gpd.GeoDataFrame): The GeoDataFrame of stations which should be included in the matrices
+        stop (list): The stop names of the stations for the messages
+        network (NetworkxEngine): The routing engine containing the graph of the preprocessed rail network
+        mirror_matrix (bool): If True it takes distances which are already calculated for a pair of stations
+        workers (int): If > 1 the searches of the origin stations run in parallel worker processes
+
+    Returns:
+        tuple: (distance_matrix, path_matrix, error_city), error_city is None if all paths could be found
+    """
+    stations = list(gdf_input_stations["name"])
+    # Select the node of each station by name (like in shortest_path the first station with this name)
+    nodes = []
+    for st in stations:
+        station_point = gdf_input_stations["geometry"][gdf_input_stations['name'] == st].iloc[0]
+        nodes.append(network.station_node(station_point))
+
+    distance_matrix = [[0] * len(stations) for _ in stations]
+    path_matrix = [[None] * len(stations) for _ in stations]
+
+    # Only search for the destinations which are not known yet and skip destinations at the same node as the origin
+    # (distance = 0 and path = None)
+    destinations = []
+    for index_origin in range(len(stations)):
+        if mirror_matrix == True:
+            index_destinations = list(range(index_origin + 1, len(stations)))
+        else:
+            index_destinations = [i for i in range(len(stations)) if i != index_origin]
+        destinations.append([i for i in index_destinations if nodes[i] != nodes[index_origin]])
+
+    # The rows are independent of each other, so they can be searched in parallel before filling the matrices
+    if workers > 1:
+        queries = [(nodes[index_origin], [nodes[i] for i in destinations[index_origin]]) for index_origin in range(len(stations))]
+        row_paths = parallel_shortest_paths(network, queries, workers)
+
+    for index_origin in range(len(stations)):
+        if mirror_matrix == True:
+            for index_destination in range(index_origin):
+                distance_matrix[index_origin][index_destination] = distance_matrix[index_destination][index_origin]
+                path = path_matrix[index_destination][index_origin]
+                if path is not None:
+                    path_matrix[index_origin][index_destination] = sg.LineString(list(path.coords)[::-1])
+
+        index_destinations = destinations[index_origin]
+        if index_destinations == []:
+            continue
+
+        if workers > 1:
+            paths = row_paths[index_origin]
+        else:
+            paths = network.shortest_paths(nodes[index_origin], [nodes[i] for i in index_destinations])
+
+        for index_destination in index_destinations:
+            if nodes[index_destination] not in paths:
+                e.info(f"no path between {stations[index_origin]} to {stations[index_destination]}")
+                if len(stations) == 2:
+                    return distance_matrix, path_matrix, f"{stop[index_destination]} or {stop[index_origin]}"
+                # if the origin reaches any other station the destination is the problem
+                other_nodes = [node for node in nodes if node != nodes[index_origin]]
+                if network.shortest_paths(nodes[index_origin], other_nodes) != {}:
+                    e.info(f"destination problem: {stop[index_destination]}")
+                    return distance_matrix, path_matrix, stop[index_destination]
+                e.info(f"origin problem: {stop[index_origin]}")
+                return distance_matrix, path_matrix, stop[index_origin]
+
+            path = paths[nodes[index_destination]]
+            distance = path.length/1000
+            e.info(f"from {stop[index_origin]} to {stop[index_destination]} it takes {round(distance, 0)} kilometers")
+            distance_matrix[index_origin][index_destination] = distance
+            path_matrix[index_origin][index_destination] = path
+
+    return distance_matrix, path_matrix, None
+
+
+def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, network, mirror_matrix: bool, one_to_many: bool = False, workers: int = 1) -> dict:
     """This function creates a matrices for shortest paths and distances including all possible combinations between 
         input station list.
 
     Args:
         gdf_input_stations (gpd.GeoDataFrame): The GeoDataFrame of stations contains each station which should be included 
                         in the matrices
-        rail_segments_gdf (gpd.GeoDataFrame): The preprocessed GeoDataFrame containing the rail network
+        network (NetworkxEngine): The routing engine containing the graph of the preprocessed rail network
         mirror_matrix (bool): If True it takes distances which are already calculated for a pair of stations
                         assumption: distance(1->2) = distance(2->1)
+        one_to_many (bool): If True it runs one search per origin station for all destinations (by def one_to_many_matrices)
+                        instead of one search per pair of stations
+        workers (int): Number of worker processes for the searches of the origin stations (only with one_to_many)
 
     Returns:
         dict: 
@@ -146,6 +273,22 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
     distance_matrix = []
     path_matrix = []
 
+    # if the stations are labelled by the connected components of the network, unreachable stations are found at once
+    if "component" in gdf_input_stations.columns:
+        error_city = unreachable_city(gdf_input_stations, stop)
+        if error_city is not None:
+            dict_distance_matrix["error_city"] = error_city
+            return dict_distance_matrix
+
+    if one_to_many == True:
+        distance_matrix, path_matrix, error_city = one_to_many_matrices(gdf_input_stations, stop, network, mirror_matrix, workers)
+        if error_city is not None:
+            dict_distance_matrix["error_city"] = error_city
+            return dict_distance_matrix
+        dict_distance_matrix["distance_matrix"] = distance_matrix
+        dict_distance_matrix["path_matrix"] = path_matrix
+        return dict_distance_matrix
+
     # Loop over all stations as origins
     for st_origin in stations:
         index_origin = stations.index(st_origin)
@@ -178,7 +321,7 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
             # Only calculate the path and distance new if the destination station is listed after the origin station in the stations list
             elif (index_destination > index_origin) and (mirror_matrix == True):
                 try:    
-                    shortest_path_result = shortest_path(gdf_input_stations, st_origin, st_destination, rail_segments_gdf)
+                    shortest_path_result = shortest_path(gdf_input_stations, st_origin, st_destination, network)
                     list_path_st_origin.append(shortest_path_result)
                     distance = shortest_path_result.length/1000
                     e.info(f"from {stop[index_origin]} to {stop[index_destination]} it takes {round(distance, 0)} kilometers")
@@ -195,7 +338,7 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
                         while index_dest_trial < len(stations):
                             try:
                                 dest_trial = stations[index_dest_trial]
-                                shortest_path(gdf_input_stations, st_origin, dest_trial, rail_segments_gdf)
+                                shortest_path(gdf_input_stations, st_origin, dest_trial, network)
                             except:
                                 index_dest_trial += 1
                             else: # if try worked
@@ -210,7 +353,7 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
             # If mirror_matrix = False just calculate everything
             else:
                 try:
-                    shortest_path_result = shortest_path(gdf_input_stations, st_origin, st_destination, rail_segments_gdf)
+                    shortest_path_result = shortest_path(gdf_input_stations, st_origin, st_destination, network)
                     list_path_st_origin.append(shortest_path_result)
                     distance = shortest_path_result.length/1000
                     e.info(f"from {stop[index_origin]} to {stop[index_destination]} it takes {round(distance, 0)} kilometers")
@@ -227,7 +370,7 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
                         while index_dest_trial < len(stations):
                             try:
                                 dest_trial = stations[index_dest_trial]
-                                shortest_path(gdf_input_stations, st_origin, dest_trial, rail_segments_gdf)
+                                shortest_path(gdf_input_stations, st_origin, dest_trial, network)
                             except:
                                 index_dest_trial += 1
                             else: # if try worked
@@ -250,80 +393,36 @@ def create_distance_matrix(gdf_input_stations: gpd.GeoDataFrame, rail_segments_g
     return dict_distance_matrix
 
 
-def tsp_solution(manager, routing, solution, dict_distance_matrix):
-    """ This function is part of the following tsp_calculation function, prints the route and plan_output and returns
-    the plan_output (the order of cities in the optimized route)
-
-    Returns:
-        plan_output
-    """   
-    # create the output with index names
-    index = routing.Start(0)
-    plan_output = "" #starting string
-    route_distance = 0 #starting distance
-    while not routing.IsEnd(index):
-        plan_output += f"{manager.IndexToNode(index)} " #add index to string output
-        previous_index = index 
-        index = solution.Value(routing.NextVar(index)) #define the following stop...
-        route_distance += routing.GetArcCostForVehicle(previous_index, index, 0) #...to get the distance between the stops
-    plan_output += '{} '.format(manager.IndexToNode(index))
+def tsp_solution(tsp_result: TspResult, dict_distance_matrix: dict) -> None:
+    """ This function is part of the following tsp_calculation function and prints the route with the city names
 
+    Args:
+        tsp_result (TspResult): The solution of the TSP solver
+        dict_distance_matrix (dict): The dictionary containing the stop names
+    """
     # create a string output with city names
-    route_list = plan_output.replace(",", " ")
-    route_list = route_list.split(" ")
-    route_cities = []
-    for i in route_list:
-        try:
-            i = int(i)
-            city = dict_distance_matrix["stop"][i]
-            route_cities.append(city)
-        except:
-            pass
-    route_cities = "-> ".join(route_cities)
-
-    # print the route with indices, cities and distances
-    e.info(f"Your route is: {route_cities}")
-    return plan_output
-
-
-def tsp_calculation(dict_distance_matrix: dict):
+    route_cities = "-> ".join(dict_distance_matrix["stop"][i] for i in tsp_result.order)
+
+    # print the route with cities and distance
+    e.info(f"Your route is: {route_cities} ({round(tsp_result.total_distance, 0)} kilometers)")
+
+
+def tsp_calculation(dict_distance_matrix: dict, solver: str = "auto", time_limit: int = 5) -> TspResult:
     """This function solves the Travelling Salesman Problem and finds the optimized (shortest) route to connect all
     input cities with eachother. The first city will be the start and end city in this route
 
     Args:
         dict_distance_matrix (dict): The dictionary containing the distance matrix, num_vehicles and depot
+        solver (str): The solver backend (see routing/tsp_solvers.py): "held_karp", "ortools", "two_opt" or "auto"
+        time_limit (int): Wall-clock time limit in seconds for the solvers "ortools" and "two_opt"
 
     Returns:
-        str: plan_output by def tsp_solution
+        TspResult: order of the stops (int array), distances of the legs and total distance
     """
-  
-    # Create the routing index manager.
-    manager = pywrapcp.RoutingIndexManager(len(dict_distance_matrix['distance_matrix']), dict_distance_matrix['num_vehicles'], dict_distance_matrix['depot'])
-    
-    # Create Routing Model.
-    routing = pywrapcp.RoutingModel(manager)
-    
+    tsp_result = solve_tsp(dict_distance_matrix['distance_matrix'], dict_distance_matrix['depot'], solver, time_limit)
 
-    def distance_callback(from_index, to_index):
-        """Returns the distance between the two nodes, extracted from the distance matrix"""
-        # Convert from routing variable Index to distance matrix NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return dict_distance_matrix['distance_matrix'][from_node][to_node]
-    
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    
-    # Define cost of each arc.
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-    
-    # Setting first solution heuristic.
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
-    
-    # Solve the problem.
-    solution = routing.SolveWithParameters(search_parameters)
-    
-    # Print solution on console and returns plan_ouput.
-    if solution: 
-        plan_output = tsp_solution(manager, routing, solution, dict_distance_matrix)
-        return plan_output
\ No newline at end of file
+    # Print solution on console
+    if tsp_result is not None:
+        tsp_solution(tsp_result, dict_distance_matrix)
+
+    return tsp_result
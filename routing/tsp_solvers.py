@@ -0,0 +1,256 @@
+import time
+from typing import NamedTuple
+import numpy as np
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+import etl as e
+
+class TspResult(NamedTuple):
+    """Result of the TSP solvers
+
+    Attributes:
+        order (np.ndarray): int array with the indices of the stops in the route, starting and ending at the depot
+        leg_distances (np.ndarray): float array with the distance of each leg (order[i] -> order[i+1])
+        total_distance (float): Sum of the leg distances
+    """
+    order: np.ndarray
+    leg_distances: np.ndarray
+    total_distance: float
+
+
+# Maximum number of stops for the exact solver and for OR-Tools with solver="auto"
+MAX_STOPS_HELD_KARP = 12
+MAX_STOPS_ORTOOLS = 200
+# OR-Tools stops when the route has not become shorter for this many seconds per stop (at least 1 s, at most the
+# time limit), because guided local search would otherwise always run until the time limit
+ORTOOLS_STALL_TIME_PER_STOP = 0.05
+
+
+def _tsp_result(distance_matrix: np.ndarray, order: list) -> TspResult:
+    """Returns the TspResult of an order of the stops
+
+    Args:
+        distance_matrix (np.ndarray): n x n matrix of the distances between the stops
+        order (list): Order of the stops, starting and ending at the depot
+
+    Returns:
+        TspResult: The order with the distances of the legs
+    """
+    order = np.asarray(order, dtype=np.int64)
+    leg_distances = np.asarray(distance_matrix, dtype=np.float64)[order[:-1], order[1:]]
+    return TspResult(order=order, leg_distances=leg_distances, total_distance=float(leg_distances.sum()))
+
+
+def held_karp(distance_matrix: np.ndarray, depot: int) -> TspResult:
+    """Exact solution of the TSP by dynamic programming (Held-Karp). The costs grow with 2^n, so it is only used for
+    small itineraries (up to MAX_STOPS_HELD_KARP stops)
+
+    Args:
+        distance_matrix (np.ndarray): n x n matrix of the distances between the stops
+        depot (int): Index of the start and end stop
+
+    Returns:
+        TspResult: Order of the stops, starting and ending at the depot, with the distances of the legs
+    """
+    n = len(distance_matrix)
+    others = [i for i in range(n) if i != depot]
+    m = len(others)
+    if m == 0:
+        return _tsp_result(distance_matrix, [depot, depot])
+    d = distance_matrix.tolist()
+
+    # cost[mask][j]: shortest path from the depot through the stops in mask, ending at others[j]
+    full = 1 << m
+    cost = [[np.inf] * m for _ in range(full)]
+    parent = [[-1] * m for _ in range(full)]
+    for j in range(m):
+        cost[1 << j][j] = d[depot][others[j]]
+
+    for mask in range(1, full):
+        for j in range(m):
+            if not mask & (1 << j) or cost[mask][j] == np.inf:
+                continue
+            for k in range(m):
+                if mask & (1 << k):
+                    continue
+                new_mask = mask | (1 << k)
+                new_cost = cost[mask][j] + d[others[j]][others[k]]
+                if new_cost < cost[new_mask][k]:
+                    cost[new_mask][k] = new_cost
+                    parent[new_mask][k] = j
+
+    # close the tour and walk back the parents
+    last = min(range(m), key=lambda j: cost[full - 1][j] + d[others[j]][depot])
+    order = []
+    mask = full - 1
+    while last != -1:
+        order.append(others[last])
+        mask, last = mask ^ (1 << last), parent[mask][last]
+    order.reverse()
+
+    return _tsp_result(distance_matrix, [depot] + order + [depot])
+
+
+def ortools_tsp(distance_matrix: np.ndarray, depot: int, time_limit: int) -> TspResult:
+    """Solution of the TSP with OR-Tools. The distances are registered once as an integer matrix in meters and the
+    first solution is improved by guided local search until the route has not become shorter for a while (see
+    ORTOOLS_STALL_TIME_PER_STOP) or the time limit is reached
+
+    Args:
+        distance_matrix (np.ndarray): n x n matrix of the distances between the stops in km
+        depot (int): Index of the start and end stop
+        time_limit (int): Wall-clock time limit of the search in seconds
+
+    Returns:
+        TspResult: Order of the stops, starting and ending at the depot, with the distances of the legs (None if no
+        solution was found)
+    """
+    # Create the routing index manager and Routing Model.
+    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), 1, depot)
+    routing = pywrapcp.RoutingModel(manager)
+
+    # integer costs in meters (OR-Tools works with integers only)
+    int_matrix = np.rint(np.asarray(distance_matrix) * 1000).astype(np.int64).tolist()
+    if hasattr(routing, "RegisterTransitMatrix"):
+        transit_callback_index = routing.RegisterTransitMatrix(int_matrix)
+    else:
+        def distance_callback(from_index, to_index):
+            """Returns the distance between the two nodes, extracted from the integer matrix"""
+            return int_matrix[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+
+    # Define cost of each arc.
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    # First solution by the cheapest arc, then guided local search until the time limit
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.local_search_metaheuristic = (routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    search_parameters.time_limit.seconds = int(time_limit)
+
+    # Stop the search when the best route has not improved within the stall time
+    stall_time = min(time_limit, max(1, ORTOOLS_STALL_TIME_PER_STOP * len(distance_matrix)))
+    best = {"cost": None, "time": time.time()}
+
+    def stop_without_improvement():
+        """Finishes the search if the cost of the best solution has not decreased within the stall time"""
+        cost = routing.CostVar().Max()
+        if best["cost"] is None or cost < best["cost"]:
+            best["cost"], best["time"] = cost, time.time()
+        elif time.time() - best["time"] > stall_time:
+            routing.solver().FinishCurrentSearch()
+    routing.AddAtSolutionCallback(stop_without_improvement)
+
+    # Solve the problem.
+    solution = routing.SolveWithParameters(search_parameters)
+    if not solution:
+        return None
+
+    index = routing.Start(0)
+    order = []
+    while not routing.IsEnd(index):
+        order.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    order.append(manager.IndexToNode(index))
+
+    return _tsp_result(distance_matrix, order)
+
+
+def two_opt(distance_matrix: np.ndarray, depot: int, time_limit: int) -> TspResult:
+    """Heuristic solution of the TSP for very large itineraries: nearest neighbour tour which is improved by 2-opt
+    (reversing parts of the tour) and Or-opt (moving chains of up to three stops) until no move improves the tour
+    or the time limit is reached. The moves assume a symmetric distance matrix
+
+    Args:
+        distance_matrix (np.ndarray): n x n matrix of the distances between the stops
+        depot (int): Index of the start and end stop
+        time_limit (int): Wall-clock time limit in seconds
+
+    Returns:
+        TspResult: Order of the stops, starting and ending at the depot, with the distances of the legs
+    """
+    d = np.asarray(distance_matrix, dtype=np.float64)
+    n = len(d)
+    if n <= 3:
+        return _tsp_result(d, [depot] + [i for i in range(n) if i != depot] + [depot])
+    end_time = time.time() + time_limit
+
+    # nearest neighbour tour
+    tour = [depot]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[depot] = False
+    while unvisited.any():
+        candidates = np.where(unvisited, d[tour[-1]], np.inf)
+        tour.append(int(np.argmin(candidates)))
+        unvisited[tour[-1]] = False
+    tour.append(depot)
+    tour = np.array(tour)
+
+    improved = True
+    while improved and time.time() < end_time:
+        improved = False
+
+        # 2-opt: replace the edges (a, b) and (c, f) by (a, c) and (b, f) and reverse the part b...c
+        for i in range(1, n - 1):
+            a, b = tour[i - 1], tour[i]
+            c, f = tour[i + 1:n], tour[i + 2:n + 1]
+            delta = d[a, c] + d[b, f] - d[a, b] - d[c, f]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                tour[i:i + j + 2] = tour[i:i + j + 2][::-1].copy()
+                improved = True
+
+        # Or-opt: move a chain of 1 to 3 stops between two other stops
+        for length in (1, 2, 3):
+            i = 1
+            while i + length <= n:
+                chain = tour[i:i + length]
+                previous, following = tour[i - 1], tour[i + length]
+                removed = d[previous, chain[0]] + d[chain[-1], following] - d[previous, following]
+                rest = np.concatenate([tour[:i], tour[i + length:]])
+                # insert between rest[k] and rest[k+1] (in both directions of the chain)
+                insert = d[rest[:-1], chain[0]] + d[chain[-1], rest[1:]] - d[rest[:-1], rest[1:]]
+                insert_reversed = d[rest[:-1], chain[-1]] + d[chain[0], rest[1:]] - d[rest[:-1], rest[1:]]
+                k = int(np.argmin(insert))
+                k_reversed = int(np.argmin(insert_reversed))
+                if min(insert[k], insert_reversed[k_reversed]) < removed - 1e-9:
+                    if insert[k] <= insert_reversed[k_reversed]:
+                        tour = np.concatenate([rest[:k + 1], chain, rest[k + 1:]])
+                    else:
+                        tour = np.concatenate([rest[:k_reversed + 1], chain[::-1], rest[k_reversed + 1:]])
+                    improved = True
+                i += 1
+
+    return _tsp_result(d, tour)
+
+
+def solve_tsp(distance_matrix: list, depot: int, solver: str = "auto", time_limit: int = 5) -> TspResult:
+    """This function solves the TSP with the chosen solver backend
+
+    Args:
+        distance_matrix (list): n x n matrix of the distances between the stops in km
+        depot (int): Index of the start and end stop
+        solver (str): "held_karp" (exact), "ortools", "two_opt" or "auto" (chosen by the number of stops)
+        time_limit (int): Wall-clock time limit in seconds for "ortools" and "two_opt"
+
+    Returns:
+        TspResult: The order of the stops with the distances of the legs (None if no solution was found)
+    """
+    distance_matrix = np.asarray(distance_matrix, dtype=np.float64)
+    n = len(distance_matrix)
+    if solver == "auto":
+        if n <= MAX_STOPS_HELD_KARP:
+            solver = "held_karp"
+        elif n <= MAX_STOPS_ORTOOLS:
+            solver = "ortools"
+        else:
+            solver = "two_opt"
+
+    e.info(f"ROUTING: SOLVING TSP FOR {n} STOPS WITH {solver}")
+    if solver == "held_karp":
+        return held_karp(distance_matrix, depot)
+    if solver == "ortools":
+        return ortools_tsp(distance_matrix, depot, time_limit)
+    if solver == "two_opt":
+        return two_opt(distance_matrix, depot, time_limit)
+    raise ValueError(f"Unknown TSP solver: {solver}")
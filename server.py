@@ -78,14 +78,14 @@ def base(str1, str2, str3, str4, str5, str6):
     )
 
     # Prepare route data
-    gdf_best_route = gpd.read_file("data/route/best_route")
+    gdf_best_route = e.read_gdf("data/route/best_route")
     gdf_best_route = gdf_best_route.to_crs("EPSG:4326")
     # create lines from shapely (lon, lat), to folium (lat, lon)
     gdf_best_route = ff.line_geom(gdf_best_route)
 
     # Prepare close city data if not empty
     try:
-        gdf_close_cities = gpd.read_file("data/route/close_cities").set_crs("EPSG:32629")
+        gdf_close_cities = e.read_gdf("data/route/close_cities").set_crs("EPSG:32629")
         gdf_close_cities = gdf_close_cities.to_crs("EPSG:4326")
         # create lines from shapely (lon, lat), to folium (lat, lon)
         gdf_close_cities = ff.point_geom(gdf_close_cities)
@@ -93,7 +93,7 @@ def base(str1, str2, str3, str4, str5, str6):
 
     # Prepare close heritage data if not empty
     try: 
-        gdf_close_heris = gpd.read_file("data/route/close_heris").set_crs("EPSG:32629")
+        gdf_close_heris = e.read_gdf("data/route/close_heris").set_crs("EPSG:32629")
         gdf_close_heris = gdf_close_heris.to_crs("EPSG:4326")
         # create lines from shapely (lon, lat), to folium (lat, lon)
         gdf_close_heris = ff.point_geom(gdf_close_heris)
@@ -101,7 +101,7 @@ def base(str1, str2, str3, str4, str5, str6):
 
     # Prepare close nature data if not empty
     try: 
-        gdf_close_natus = gpd.read_file("data/route/close_natus").set_crs("EPSG:32629")
+        gdf_close_natus = e.read_gdf("data/route/close_natus").set_crs("EPSG:32629")
         gdf_close_natus = gdf_close_natus.to_crs("EPSG:4326")
     except: pass
     
@@ -0,0 +1,31 @@
+import multiprocessing
+import geopandas as gpd
+import pytest
+from shapely.geometry import LineString
+import routing as r
+
+
+@pytest.fixture
+def network():
+    # a ladder of 4 x 2 nodes with rungs of 100 m and rails of 1000 m
+    lines = [LineString([(x, 0), (x + 1000, 0)]) for x in range(0, 3000, 1000)]
+    lines += [LineString([(x, 100), (x + 1000, 100)]) for x in range(0, 3000, 1000)]
+    lines += [LineString([(x, 0), (x, 100)]) for x in range(0, 4000, 1000)]
+    return r.CsrEngine(gpd.GeoDataFrame(geometry=lines, crs="EPSG:32629"))
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_parallel_paths_equal_serial_paths(network, monkeypatch, start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} is not available")
+    # without fork (Windows) the workers are spawned
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: [start_method])
+
+    nodes = [tuple(coords) for coords in network.node_coords]
+    queries = [(node, [end_node for end_node in nodes if end_node != node]) for node in nodes]
+    results = r.parallel_shortest_paths(network, queries, workers=2)
+
+    for (start_node, end_nodes), paths in zip(queries, results):
+        expected = network.shortest_paths(start_node, end_nodes)
+        assert sorted(paths) == sorted(expected)
+        assert all(abs(paths[end_node].length - expected[end_node].length) < 1e-6 for end_node in expected)
@@ -0,0 +1,36 @@
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point, LineString
+import routing as r
+
+CRS = "EPSG:32629"
+
+
+def preprocess_country(station_gdf, rail_gdf):
+    """The standalone network of one country like def preprocess_country in main.py"""
+    station_gdf = r.snap_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=50)
+    rail_gdf = r.connect_points_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=500)
+    rail_gdf = r.split_line_spatial_index(point_gdf=station_gdf, line_gdf=rail_gdf, offset=2)
+    return r.node_network(point_gdf=station_gdf, line_gdf=rail_gdf, grid=0.1)
+
+
+def test_shared_border_way_is_split_at_the_stations_of_both_countries():
+    # one 10 km way which is in the data of country A and of country B, A1 at 4 km and B1 at 6 km
+    way = LineString([(0, 0), (2500, 0), (5000, 0), (7500, 0), (10000, 0)])
+    networks = []
+    for country, station, x in [("A", "A1", 4000), ("B", "B1", 6000)]:
+        station_gdf = gpd.GeoDataFrame({"name": [station]}, geometry=[Point(x, 10)], crs=CRS)
+        rail_gdf = gpd.GeoDataFrame({"name": ["border way"], "country": [country]}, geometry=[way], crs=CRS)
+        networks.append(preprocess_country(station_gdf, rail_gdf))
+
+    station_all_gdf = gpd.GeoDataFrame(pd.concat([network[0] for network in networks], ignore_index=True), crs=CRS)
+    rail_all_gdf = gpd.GeoDataFrame(pd.concat([network[1] for network in networks], ignore_index=True), crs=CRS)
+    station_all_gdf, rail_all_gdf = r.stitch_networks(point_gdf=station_all_gdf, line_gdf=rail_all_gdf, grid=0.1)
+
+    network = r.CsrEngine(rail_all_gdf)
+    a1, b1 = [network.station_node(point) for point in station_all_gdf.geometry]
+    path = network.shortest_path(a1, b1)
+
+    assert abs(path.length - 2000) < 1
+    # the two copies of the way are one network after the stitching
+    assert abs(rail_all_gdf.length.sum() - 10000) < 1
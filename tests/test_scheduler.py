@@ -0,0 +1,105 @@
+import json
+import time
+import threading
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+import etl as e
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Overpass API stub: answers each query with server.respond(query) -> (status, headers, elements)"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["data"][0]
+        with self.server.lock:
+            self.server.requests.append((time.monotonic(), query))
+        status, headers, elements = self.server.respond(query)
+        body = json.dumps({"elements": elements}).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def scheduler(server, tmp_path, **kwargs):
+    """DownloadScheduler for the stub server without rate limit"""
+    return e.DownloadScheduler(f"http://127.0.0.1:{server.server_port}/api/interpreter", rate=100, burst=10,
+                               download_dir=str(tmp_path), **kwargs)
+
+
+def layer(name: str, elements: list) -> list:
+    """The elements of a layer in a combined query with its marker element"""
+    return [{"type": "layer", "id": 0, "tags": {"name": name}}] + elements
+
+
+def node(node_id: int) -> dict:
+    return {"type": "node", "id": node_id, "lat": 0.5, "lon": 0.5, "tags": {"name": f"station {node_id}"}}
+
+
+def way(way_id: int) -> dict:
+    return {"type": "way", "id": way_id, "nodes": [1, 2], "tags": {"railway": "rail"},
+            "geometry": [{"lat": 0.1, "lon": 0.1}, {"lat": 0.9, "lon": 0.9}]}
+
+
+def test_retry_after_of_http_429_is_respected(server, tmp_path):
+    responses = iter([(429, {"Retry-After": "1"}, []), (200, {}, [node(1)])])
+    server.respond = lambda query: next(responses)
+
+    # the backoff without Retry-After would be at least 5 s
+    result = scheduler(server, tmp_path, backoff=10).fetch("query", "Stations", "X")
+
+    assert result["elements"] == [node(1)]
+    assert len(server.requests) == 2
+    assert 0.9 <= server.requests[1][0] - server.requests[0][0] < 5
+
+
+def test_download_with_an_empty_required_layer_is_repeated(server, tmp_path):
+    responses = iter([(200, {}, layer("station", [node(1)]) + layer("rail", []) + layer("city", [node(3)])),
+                      (200, {}, layer("station", [node(1)]) + layer("rail", [way(2)]) + layer("city", [node(3)]))])
+    server.respond = lambda query: next(responses)
+    filenames = {name: str(tmp_path / name) for name in ["station", "rail", "city"]}
+
+    scheduler(server, tmp_path, backoff=0.01).download(
+        [(e.query_country("X", list(filenames)), "All layers", "X", filenames)], e.save_layers, check=e.has_required_layers)
+
+    assert len(server.requests) == 2
+    assert [list(e.iter_elements(e.raw_path(filenames[name]))) for name in filenames] == [[node(1)], [way(2)], [node(3)]]
+
+
+def test_tiles_are_merged_without_duplicates(server, tmp_path):
+    # every tile has the shared station 1 and the way 7 across the tiles and one station of its own
+    def respond(query):
+        own = 1000 + zlib.crc32(query.encode()) % 1000
+        return 200, {}, layer("station", [node(1), node(own)]) + layer("rail", [way(7)])
+    server.respond = respond
+    filenames = {name: str(tmp_path / name) for name in ["station", "rail"]}
+
+    tiled = e.download_tiles(scheduler(server, tmp_path), "X", filenames, 1, str(tmp_path / "tiles_X"), (0, 0, 2, 2))
+
+    assert tiled == True
+    assert len(server.requests) == 4
+    stations = list(e.iter_elements(e.raw_path(filenames["station"])))
+    assert len(stations) == 5 and len({station["id"] for station in stations}) == 5
+    assert list(e.iter_elements(e.raw_path(filenames["rail"]))) == [way(7)]
+    with open(f"{filenames['station']}.meta.json") as file:
+        assert json.load(file)["elements"] == 5
+    assert not (tmp_path / "tiles_X").exists()